@@ -0,0 +1 @@
+default_app_config = u'gdpr.apps.GDPRConfig'
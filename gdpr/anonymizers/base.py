@@ -82,6 +82,13 @@ class FieldAnonymizer(object):
     def get_deanonymized_value_from_version(self, obj, version, name, encryption_key):
         return self.get_value_from_version(obj, version, name, encryption_key, anonymization=False)
 
+    def get_db_expression(self, name, connection):
+        u"""
+        Database expression computing anonymized value of the model field `name` without loading it, e.g. for
+        queryset anonymization. Return None if the value has to be anonymized in python.
+        """
+        return None
+
     def get_anonymized_value(self, value):
         u"""
         Deprecated
@@ -3,18 +3,99 @@ from __future__ import absolute_import
 
 import hashlib
 
+from django.db.models import CharField, F, Func
+from django.db.models.functions import Length, Substr
+
 from gdpr.anonymizers.base import FieldAnonymizer
 
 
+class MD5(Func):
+    u"""Hex encoded MD5 digest of the text, supported by PostgreSQL and MySQL."""
+
+    function = u'MD5'
+
+
+class SHA256(Func):
+    u"""Hex encoded SHA-256 digest of the text, supported by PostgreSQL 11+ and MySQL."""
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(compiler, connection, template=u"ENCODE(SHA256(CONVERT_TO(%(expressions)s, 'UTF8')), 'hex')")
+
+    def as_mysql(self, compiler, connection):
+        return self.as_sql(compiler, connection, template=u'SHA2(%(expressions)s, 256)')
+
+
+def _supports_sha256_function(connection):
+    return connection.vendor == u'mysql' or (
+        connection.vendor == u'postgresql' and getattr(connection, u'pg_version', 0) >= 110000
+    )
+
+
 class BaseHashTextFieldAnonymizer(FieldAnonymizer):
     algorithm = None
     is_reversible = False
+    use_db_expression = False
+
+    # Methods computing the anonymized value in python, the database expression is not used if one is overridden
+    python_value_methods = (
+        u'get_encrypted_value', u'get_is_value_empty', u'get_ignore_empty_values', u'_get_anonymized_value_from_value'
+    )
+
+    # algorithm: (database function, function checking whether the database connection supports it)
+    db_functions = {
+        u'md5': (MD5, lambda connection: connection.vendor in (u'postgresql', u'mysql')),
+        u'sha256': (SHA256, _supports_sha256_function),
+    }
+
+    def __init__(self, ignore_empty_values = None, empty_values = None,
+                 use_db_expression = None):
+        u"""
+        Args:
+            ignore_empty_values: defines if empty value of a model will be ignored or should be anonymized too
+            empty_values: defines list of values which are considered as empty
+            use_db_expression: defines if queryset anonymization should hash values in the database if it supports
+                the hash algorithm
+        """
+        if use_db_expression is not None:
+            self.use_db_expression = use_db_expression
+        super(BaseHashTextFieldAnonymizer, self).__init__(ignore_empty_values, empty_values)
 
     def get_encrypted_value(self, value, encryption_key):
         h = hashlib.new(self.algorithm)
         h.update(value.encode(u'utf-8'))
         return h.hexdigest()[:len(value)] if value else value
 
+    def is_python_value_method_overridden(self):
+        u"""Return True if a subclass overrides a method computing the value which the database expression replaces."""
+        for name in self.python_value_methods:
+            defining_class = next(klass for klass in type(self).__mro__ if name in klass.__dict__)
+            if defining_class not in BaseHashTextFieldAnonymizer.__mro__:
+                return True
+        return False
+
+    def get_db_expression(self, name, connection):
+        u"""
+        Get database expression which computes the same value as `get_encrypted_value` from the model field.
+
+        Args:
+            name: Name of the model field
+            connection: Database connection the expression will be used with
+
+        Returns:
+            Expression or None if the database does not support the hash algorithm
+        """
+        if not self.use_db_expression or self.algorithm not in self.db_functions:
+            return None
+        # SQL functions return NULL for NULL which is the same as ignoring None only
+        if not self._ignore_empty_values or list(self._empty_values) != [None]:
+            return None
+        if self.is_python_value_method_overridden():
+            return None
+        db_function, is_supported = self.db_functions[self.algorithm]
+        if not is_supported(connection):
+            return None
+        return Substr(db_function(F(name), output_field=CharField()), 1, Length(F(name)), output_field=CharField())
+
 
 class MD5TextFieldAnonymizer(BaseHashTextFieldAnonymizer):
     algorithm = u'md5'
@@ -2,28 +2,43 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
-import hashlib
+import operator
 import random
 import string
 import warnings
+from contextlib import contextmanager
+from functools import reduce
 
 from django.conf import settings
-from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
-from django.db import transaction
+from django.db import connections, router, transaction
+from django.db.models import prefetch_related_objects
 from typing import (
     Any, KeysView, List, Tuple, Union
 )
 
 from gdpr.anonymizers.base import FieldAnonymizer, RelationAnonymizer
+from gdpr.content_types import get_content_type, get_content_type_id
+from gdpr.encryption import derive_encryption_key, get_settings_encryption_key
+from gdpr.enums import AnonymizationUpdateMode
 from gdpr.fields import Fields
+from gdpr.instrumentation import get_instrumentation, get_tags
 from gdpr.models import AnonymizedData
-from gdpr.utils import get_field_or_none, get_reversion_version_model
+from gdpr.utils import (
+    bulk_update, chunked, count_queries, get_field_or_none, get_object_id_filter, get_object_id_int,
+    get_reversion_version_model
+)
+from gdpr.versions import SerializedVersionData
 
 FieldList = Union[List, Tuple, KeysView[unicode]]  # List, tuple or return of dict keys() method.
 FieldMatrix = Union[unicode, Tuple[Any, ...]]
 
 
+@contextmanager
+def _null_context():
+    yield
+
+
 class ModelAnonymizerMeta(type):
     u"""
     Metaclass for anonymizers. The main purpose of the metaclass is to register anonymizers and find field anonymizers
@@ -61,12 +76,19 @@ class ModelAnonymizerBase(object):
     can_anonymize_qs = None
     fields = None
     _base_encryption_key = None
+    _anonymized_fields_cache = None
+    lookup_chunk_size = 500
+    version_chunk_size = 1000
 
     class IrreversibleAnonymizerException(Exception):
         pass
 
+    class QueryBudgetExceededException(Exception):
+        pass
+
     def __init__(self, base_encryption_key = None):
         self._base_encryption_key = base_encryption_key
+        self._anonymized_fields_cache = {}
 
     @property
     def model(self):
@@ -75,7 +97,11 @@ class ModelAnonymizerBase(object):
     @property
     def content_type(self):
         u"""Get model ContentType"""
-        return ContentType.objects.get_for_model(self.model)
+        return get_content_type(self.model)
+
+    @property
+    def content_type_id(self):
+        return get_content_type_id(self.model)
 
     def __getitem__(self, item):
         return self.fields[item]
@@ -99,12 +125,19 @@ class ModelAnonymizerBase(object):
     def get(self, *args, **kwargs):
         return self.fields.get(*args, **kwargs)
 
-    def _get_encryption_key(self, obj, field_name):
-        u"""Hash encryption key from `get_encryption_key` and append settings.GDPR_KEY or settings.SECRET_KEY."""
-        return hashlib.sha256(
-            u'{}::{}::'
-            u'{}::{}'.format((obj.pk), (self.get_encryption_key(obj)), (settings.GDPR_KEY if hasattr(settings, u"GDPR_KEY") else settings.SECRET_KEY), (field_name)).encode(
-                u'utf-8')).hexdigest()
+    def _get_object_encryption_key(self, obj):
+        u"""Join obj pk, key from `get_encryption_key` and settings.GDPR_KEY or settings.SECRET_KEY."""
+        return u'{}::{}::{}'.format(obj.pk, self.get_encryption_key(obj), get_settings_encryption_key())
+
+    def _get_encryption_key(self, obj, field_name, object_encryption_key = None):
+        u"""
+        Hash encryption key from `get_encryption_key` and append settings.GDPR_KEY or settings.SECRET_KEY.
+
+        Pass `object_encryption_key` from `_get_object_encryption_key` to derive keys of more fields of the same object.
+        """
+        return derive_encryption_key(
+            object_encryption_key or self._get_object_encryption_key(obj), field_name, cache=self.is_reversible(obj)
+        )
 
     def is_reversible(self, obj):
         if hasattr(self.Meta, u'reversible_anonymization'):  # type: ignore
@@ -116,6 +149,51 @@ class ModelAnonymizerBase(object):
             return self.Meta.anonymize_reversion  # type: ignore
         return False
 
+    def get_update_mode(self, obj):
+        u"""
+        Get the way how anonymized values are written to the database, set by `Meta.update_mode`.
+
+        AnonymizationUpdateMode.SAVE calls `obj.save()`, AnonymizationUpdateMode.UPDATE_FIELDS calls
+        `obj.save(update_fields=...)` with anonymized fields only and AnonymizationUpdateMode.QUERYSET updates
+        anonymized columns with a queryset `update()` without calling `save()` and its signals.
+        """
+        return AnonymizationUpdateMode(getattr(self.Meta, u'update_mode', AnonymizationUpdateMode.SAVE))  # type: ignore
+
+    def get_query_budget(self):
+        u"""
+        Get maximal number of queries of anonymization of one object by `anonymize_obj` or `deanonymize_obj`.
+
+        Set by `Meta.query_budget`, defaults to settings.GDPR_QUERY_BUDGET. None means no budget.
+        """
+        return getattr(self.Meta, u'query_budget', getattr(settings, u'GDPR_QUERY_BUDGET', None))  # type: ignore
+
+    @contextmanager
+    def query_budget_guard(self, obj):
+        u"""
+        Count queries of the block and check them against the query budget of the anonymizer.
+
+        The guard is enabled by settings.GDPR_QUERY_BUDGET_ACTION. With `warn` a warning is issued when the budget is
+        exceeded, with `raise` the block runs in a transaction which is rolled back and QueryBudgetExceededException
+        is raised. Only queries of the write database of the model are counted.
+        """
+        action = getattr(settings, u'GDPR_QUERY_BUDGET_ACTION', None)
+        budget = self.get_query_budget() if action else None
+        if budget is None:
+            yield
+            return
+
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using) if action == u'raise' else _null_context():
+            with count_queries(using) as queries:
+                yield
+            if queries.count > budget:
+                message = u'{} executed {} queries for obj with pk {}, the query budget is {}.'.format(
+                    self.__class__.__name__, queries.count, obj.pk, budget
+                )
+                if action == u'raise':
+                    raise self.QueryBudgetExceededException(message)
+                warnings.warn(message)
+
     def get_encryption_key(self, obj):
         if not self.is_reversible(obj):
             return u''.join(random.choices(string.digits + string.ascii_letters, k=128))
@@ -132,9 +210,41 @@ class ModelAnonymizerBase(object):
     def is_field_anonymized(self, obj, name):
         u"""Check if field have AnonymizedData record"""
         return AnonymizedData.objects.filter(
-            field=name, is_active=True, content_type=self.content_type, object_id=unicode(obj.pk)
+            field=name, is_active=True, content_type_id=self.content_type_id,
+            **get_object_id_filter(u'object_id', self.model, obj.pk)
         ).exists()
 
+    def get_anonymized_fields_bulk(self, objs):
+        u"""
+        Get names of anonymized fields of objects with one AnonymizedData query per `lookup_chunk_size` objects.
+
+        Returns:
+            Dictionary with object pk as text keys and set of anonymized field names values
+        """
+        anonymized_fields = dict((unicode(obj.pk), set()) for obj in objs)
+        for object_ids in chunked(anonymized_fields.keys(), self.lookup_chunk_size):
+            for object_id, field in AnonymizedData.objects.filter(
+                    is_active=True, content_type_id=self.content_type_id,
+                    **get_object_id_filter(u'object_id', self.model, object_ids)
+            ).values_list(u'object_id', u'field'):
+                anonymized_fields[object_id].add(field)
+        return anonymized_fields
+
+    def preload_anonymized_fields(self, objs):
+        u"""Load anonymized fields of objects which are going to be updated by this anonymizer instance."""
+        self._anonymized_fields_cache.update(self.get_anonymized_fields_bulk(objs))
+
+    def get_anonymized_fields(self, obj):
+        u"""
+        Get set of anonymized field names of the object.
+
+        Preloaded values are used only once because the object anonymization changes them.
+        """
+        object_id = unicode(obj.pk)
+        if object_id in self._anonymized_fields_cache:
+            return self._anonymized_fields_cache.pop(object_id)
+        return self.get_anonymized_fields_bulk((obj,))[object_id]
+
     @staticmethod
     def is_generic_relation(field):
         return isinstance(field, RelationAnonymizer)
@@ -150,23 +260,56 @@ class ModelAnonymizerBase(object):
         else:
             raise NotImplementedError(u'Relation {} not supported yet.'.format((unicode(field))))
 
-    def get_value_from_obj(self, field, obj, name, anonymization = True):
-        return field.get_value_from_obj(obj, name, self._get_encryption_key(obj, name), anonymization=anonymization)
+    def get_value_from_obj(self, field, obj, name, anonymization = True,
+                           object_encryption_key = None):
+        return field.get_value_from_obj(
+            obj, name, self._get_encryption_key(obj, name, object_encryption_key), anonymization=anonymization
+        )
 
     def get_value_from_version(self, field, obj, version, name,
-                               anonymization = True):
+                               anonymization = True, object_encryption_key = None):
         return field.get_value_from_version(
-            obj, version, name, self._get_encryption_key(obj, name), anonymization=anonymization
+            obj, version, name, self._get_encryption_key(obj, name, object_encryption_key), anonymization=anonymization
         )
 
     def update_field_as_anonymized(self, obj, name, legal_reason = None,
                                    anonymization = True):
+        self.update_fields_as_anonymized(obj, (name,), legal_reason, anonymization=anonymization)
+
+    def update_fields_as_anonymized(self, obj, names, legal_reason = None,
+                                    anonymization = True):
+        self.bulk_update_fields_as_anonymized(((obj, names),), legal_reason, anonymization=anonymization)
+
+    def bulk_update_fields_as_anonymized(self, objs_fields, legal_reason = None,
+                                         anonymization = True):
+        u"""
+        Create or remove AnonymizedData records of fields of many objects at once.
+
+        Args:
+            objs_fields: Iterable of (object, field names) tuples
+            legal_reason: Legal reason stored with created records
+            anonymization: If True records are created with one bulk insert, otherwise they are removed with one
+                delete query per distinct set of field names
+        """
         if anonymization:
-            AnonymizedData.objects.create(object=obj, field=name, expired_reason=legal_reason)
+            AnonymizedData.objects.bulk_create([
+                AnonymizedData(
+                    content_type_id=self.content_type_id, object_id=unicode(obj.pk),
+                    object_id_int=get_object_id_int(obj.pk), field=name, expired_reason=legal_reason
+                )
+                for obj, names in objs_fields for name in names
+            ])
         else:
-            AnonymizedData.objects.filter(
-                field=name, is_active=True, content_type=self.content_type, object_id=unicode(obj.pk)
-            ).delete()
+            object_ids_by_fields = {}
+            for obj, names in objs_fields:
+                if names:
+                    object_ids_by_fields.setdefault(frozenset(names), []).append(unicode(obj.pk))
+            for names, object_ids in object_ids_by_fields.items():
+                for object_ids_chunk in chunked(object_ids, self.lookup_chunk_size):
+                    AnonymizedData.objects.filter(
+                        field__in=names, is_active=True, content_type_id=self.content_type_id,
+                        **get_object_id_filter(u'object_id', self.model, object_ids_chunk)
+                    ).delete()
 
     def mark_field_as_anonymized(self, obj, name, legal_reason = None):
         self.update_field_as_anonymized(obj, name, legal_reason, anonymization=True)
@@ -192,11 +335,20 @@ class ModelAnonymizerBase(object):
 
     def _perform_update(self, obj, updated_data, legal_reason = None,
                         anonymization = True):
-        for field_name, value in updated_data.items():
-            setattr(obj, field_name, value)
-        obj.save()
-        for field_name in updated_data.keys():
-            self.update_field_as_anonymized(obj, field_name, legal_reason, anonymization=anonymization)
+        with get_instrumentation().span(u'db_write', **get_tags(self.model)):
+            for field_name, value in updated_data.items():
+                setattr(obj, field_name, value)
+            self._save_obj(obj, updated_data)
+            self.update_fields_as_anonymized(obj, updated_data.keys(), legal_reason, anonymization=anonymization)
+
+    def _save_obj(self, obj, updated_data):
+        update_mode = self.get_update_mode(obj)
+        if update_mode == AnonymizationUpdateMode.UPDATE_FIELDS:
+            obj.save(update_fields=list(updated_data.keys()))
+        elif update_mode == AnonymizationUpdateMode.QUERYSET:
+            obj.__class__._base_manager.filter(pk=obj.pk).update(**updated_data)
+        else:
+            obj.save()
 
     def get_parent_models(self, model_or_obj):
         u"""From model get all it's parent models."""
@@ -220,12 +372,39 @@ class ModelAnonymizerBase(object):
         return [i for i in parent_objects if i is not None]
 
     def get_reversion_versions(self, obj):
+        u"""
+        Get list of versions of the object and all its parent objects.
+
+        If it is overridden, `update_versions` anonymizes versions returned by this method instead of streaming
+        versions of `get_reversion_versions_qs`.
+        """
         from gdpr.utils import get_reversion_versions
         versions = [i for i in get_reversion_versions(obj)]  # QuerySet to list
         parent_obj_versions = [get_reversion_versions(i) for i in self.get_all_parent_objects(obj)]
         versions += [item for sublist in parent_obj_versions for item in sublist]
         return versions
 
+    def get_reversion_versions_qs(self, obj):
+        u"""
+        Get queryset of versions of the object and all its parent objects.
+
+        Primary keys of parent objects are read from parent links of the object, parent objects are not loaded.
+        """
+        from gdpr.utils import get_reversion_versions_by_reference
+        references = [(obj.__class__, obj.pk)]
+        for parent_model in self.get_parent_models(obj):
+            parent_link = obj._meta.get_ancestor_link(parent_model)
+            references.append((parent_model, getattr(obj, parent_link.attname) if parent_link else obj.pk))
+        return reduce(operator.or_, (
+            get_reversion_versions_by_reference(model, pk) for model, pk in references if pk is not None
+        )).order_by(u'id')
+
+    def _iter_reversion_versions(self, obj):
+        default_get_reversion_versions = ModelAnonymizerBase.__dict__[u'get_reversion_versions']
+        if getattr(self.get_reversion_versions, u'__func__', None) is not default_get_reversion_versions:
+            return iter(self.get_reversion_versions(obj))
+        return self.get_reversion_versions_qs(obj).iterator()
+
     def _perform_anonymization(self, obj, updated_data,
                                legal_reason = None):
         self._perform_update(obj, updated_data, legal_reason, anonymization=True)
@@ -249,6 +428,22 @@ class ModelAnonymizerBase(object):
 
     @staticmethod
     def _perform_version_update(version, update_data):
+        instrumentation = get_instrumentation()
+        tags = get_tags(get_reversion_version_model(version))
+        with instrumentation.span(u'version_update', **tags):
+            ModelAnonymizerBase._update_version_data(version, update_data)
+        instrumentation.increment(u'versions_rewritten', **tags)
+        instrumentation.increment(u'bytes_serialized', len(version.serialized_data), **tags)
+
+    @staticmethod
+    def _update_version_data(version, update_data):
+        version_data = SerializedVersionData.from_version(version, update_data.keys())
+        if version_data is not None:
+            # JSON payload is patched directly, object is not deserialized and serialized again
+            version_data.update(update_data)
+            version.save()
+            return
+
         from reversion import revisions
         if hasattr(version, u"object_version"):
             local_obj = version.object_version.object
@@ -292,43 +487,137 @@ class ModelAnonymizerBase(object):
         u"""Update data in database and mark them as anonymized."""
         self.perform_update_with_version(obj, updated_data, updated_version_data, anonymization=False)
 
-    def anonymize_qs(self, qs):
+    def anonymize_qs(self, qs, fields = u'__ALL__',
+                     legal_reason = None,
+                     purpose = None,
+                     base_encryption_key = None):
         raise NotImplementedError()
 
-    def deanonymize_qs(self, qs):
+    def deanonymize_qs(self, qs, fields = u'__ALL__',
+                       base_encryption_key = None):
         raise NotImplementedError()
 
     def update_related_fields(self, parsed_fields, obj, legal_reason = None,
                               purpose = None, anonymization = True):
+        object_encryption_key = self._get_object_encryption_key(obj) if parsed_fields.related_fields else None
         for name, related_fields in parsed_fields.related_fields.items():
             related_attribute = getattr(obj, name, None)
             related_metafield = get_field_or_none(self.model, name)
+            base_encryption_key = self._get_encryption_key(obj, name, object_encryption_key)
             if related_attribute is None and related_metafield is None:
                 if self.is_generic_relation(getattr(self, name, None)):
-                    objs = getattr(self, name).get_related_objects(obj)
+                    objs = list(getattr(self, name).get_related_objects(obj))
+                    if related_fields.local_fields:
+                        related_fields.anonymizer.preload_anonymized_fields(objs)
                     for related_obj in objs:
                         related_fields.anonymizer.update_obj(
                             related_obj, legal_reason, purpose, related_fields,
-                            base_encryption_key=self._get_encryption_key(obj, name),
+                            base_encryption_key=base_encryption_key,
                             anonymization=anonymization
                         )
             elif related_metafield.one_to_many or related_metafield.many_to_many:
-                for related_obj in related_attribute.all():
+                related_objs = list(related_attribute.all())
+                if related_fields.local_fields:
+                    related_fields.anonymizer.preload_anonymized_fields(related_objs)
+                for related_obj in related_objs:
                     related_fields.anonymizer.update_obj(
                         related_obj, legal_reason, purpose, related_fields,
-                        base_encryption_key=self._get_encryption_key(obj, name),
+                        base_encryption_key=base_encryption_key,
                         anonymization=anonymization
                     )
             elif (related_metafield.many_to_one or related_metafield.one_to_one) and related_attribute is not None:
                 related_fields.anonymizer.update_obj(
                     related_attribute, legal_reason, purpose, related_fields,
-                    base_encryption_key=self._get_encryption_key(obj, name),
+                    base_encryption_key=base_encryption_key,
                     anonymization=anonymization
                 )
             elif related_attribute is not None:
                 warnings.warn(u'Model anonymization discovered unreachable field {} on model'
                               u'{} on obj {} with pk {}'.format((name), (obj.__class__.__name__), (obj), (obj.pk)))
 
+    def prefetch_related_objects(self, objs, parsed_fields):
+        u"""Load related objects of the whole `parsed_fields` tree of the objects with one query per relation level."""
+        select_lookups, prefetch_lookups = parsed_fields.get_related_lookups()
+        lookups = select_lookups + prefetch_lookups
+        if objs and lookups:
+            prefetch_related_objects(list(objs), *lookups)
+
+    def get_raw_local_fields(self, obj, parsed_fields, anonymization = True):
+        u"""Get names of local fields of the object which are not anonymized (or deanonymized) yet."""
+        anonymized_fields = self.get_anonymized_fields(obj) if parsed_fields.local_fields else set()
+        if anonymization:
+            return [i for i in parsed_fields.local_fields if i not in anonymized_fields]
+        return [i for i in parsed_fields.local_fields if i in anonymized_fields and self[i].get_is_reversible(obj)]
+
+    def get_update_data(self, obj, raw_local_fields, anonymization = True):
+        if not raw_local_fields:
+            return {}
+        object_encryption_key = self._get_object_encryption_key(obj)
+        return dict((
+            name, self.get_value_from_obj(self[name], obj, name, anonymization, object_encryption_key))
+            for name in raw_local_fields)
+
+    def update_versions(self, obj, raw_local_fields, anonymization = True):
+        u"""
+        Anonymize (or deanonymize) fields in all versions of the object and its parent objects.
+
+        Versions are streamed from the database (`get_reversion_versions_qs`, versions of `get_reversion_versions` are
+        used if a subclass overrides it), JSON serialized data are patched directly without creating model instances
+        and saved with one bulk update per `version_chunk_size` versions. Versions serialized to other formats are
+        updated one by one.
+        """
+        object_encryption_key = self._get_object_encryption_key(obj)
+        updated_versions = []
+        rewritten_versions = serialized_bytes = 0
+        for version in self._iter_reversion_versions(obj):
+            version_data = SerializedVersionData.from_version(version, raw_local_fields)
+            if version_data is None:
+                self._perform_version_update(version, self.get_version_update_data(
+                    obj, version, raw_local_fields, anonymization, object_encryption_key
+                ))
+                continue
+            update_data = self.get_version_update_data(
+                obj, version_data, raw_local_fields, anonymization, object_encryption_key
+            )
+            if update_data:
+                version_data.update(update_data)
+                updated_versions.append(version)
+                rewritten_versions += 1
+                serialized_bytes += len(version.serialized_data)
+            if len(updated_versions) >= self.version_chunk_size:
+                bulk_update(updated_versions, (u'serialized_data',))
+                updated_versions = []
+        if updated_versions:
+            bulk_update(updated_versions, (u'serialized_data',))
+        tags = get_tags(self.model)
+        get_instrumentation().increment(u'versions_rewritten', rewritten_versions, **tags)
+        get_instrumentation().increment(u'bytes_serialized', serialized_bytes, **tags)
+
+    def get_version_update_data(self, obj, version, raw_local_fields,
+                                anonymization = True, object_encryption_key = None):
+        u"""
+        Args:
+            version: Reversion version or its `SerializedVersionData`
+        """
+        from gdpr.utils import get_reversion_local_field_dict
+        field_dict = version if isinstance(version, SerializedVersionData) else get_reversion_local_field_dict(version)
+        return dict(
+            (name, self.get_value_from_version(self[name], obj, version, name, anonymization=anonymization,
+                                               object_encryption_key=object_encryption_key))
+            for name in raw_local_fields if name in field_dict
+        )
+
+    def get_versions_update_data(self, obj, raw_local_fields,
+                                 anonymization = True):
+        object_encryption_key = self._get_object_encryption_key(obj)
+        return [
+            (
+                version,
+                self.get_version_update_data(obj, version, raw_local_fields, anonymization, object_encryption_key)
+            )
+            for version in self.get_reversion_versions(obj)
+        ]
+
     def update_obj(self, obj, legal_reason = None,
                    purpose = None,
                    fields = u'__ALL__',
@@ -342,59 +631,175 @@ class ModelAnonymizerBase(object):
 
         parsed_fields = Fields(fields, obj.__class__) if not isinstance(fields, Fields) else fields
 
-        if anonymization:
-            raw_local_fields = [i for i in parsed_fields.local_fields if not self.is_field_anonymized(obj, i)]
-        else:
-            raw_local_fields = [i for i in parsed_fields.local_fields if
-                                self.is_field_anonymized(obj, i) and self[i].get_is_reversible(obj)]
-
-        if raw_local_fields:
-            update_dict = dict((
-                name, self.get_value_from_obj(self[name], obj, name, anonymization)) for name in raw_local_fields)
-            if self.anonymize_reversion(obj):
-                from gdpr.utils import get_reversion_local_field_dict
-                versions = self.get_reversion_versions(obj)
-                versions_update_dict = [
-                    (
-                        version,
-                        dict((
-                            name, self.get_value_from_version(self[name], obj, version, name,
-                                                              anonymization=anonymization))
-                            for name in raw_local_fields
-                            if name in get_reversion_local_field_dict(version))
-                    )
-                    for version in versions
-                ]
-                self.perform_update_with_version(
-                    obj, update_dict, versions_update_dict, legal_reason,
-                    anonymization=anonymization
+        instrumentation = get_instrumentation()
+        tags = get_tags(self.model, purpose)
+        with instrumentation.span(u'update_obj', **tags):
+            raw_local_fields = self.get_raw_local_fields(obj, parsed_fields, anonymization)
+            if raw_local_fields:
+                with instrumentation.span(u'hashing', **tags):
+                    update_dict = self.get_update_data(obj, raw_local_fields, anonymization)
+                if self.anonymize_reversion(obj):
+                    with transaction.atomic():
+                        # Versions are updated first, encryption key can depend on the values of the object
+                        with instrumentation.span(u'reversion', **tags):
+                            self.update_versions(obj, raw_local_fields, anonymization)
+                        self._perform_update(obj, update_dict, legal_reason, anonymization=anonymization)
+                else:
+                    self.perform_update(obj, update_dict, legal_reason, anonymization=anonymization)
+                instrumentation.increment(
+                    u'fields_anonymized' if anonymization else u'fields_deanonymized', len(raw_local_fields), **tags
                 )
-            else:
-                self.perform_update(obj, update_dict, legal_reason, anonymization=anonymization)
 
-        self.update_related_fields(parsed_fields, obj, legal_reason, purpose, anonymization)
+            if parsed_fields.related_fields:
+                with instrumentation.span(u'related', **tags):
+                    self.update_related_fields(parsed_fields, obj, legal_reason, purpose, anonymization)
 
     def anonymize_obj(self, obj, legal_reason = None,
                       purpose = None,
                       fields = u'__ALL__', base_encryption_key = None):
-
-        self.update_obj(obj, legal_reason, purpose, fields, base_encryption_key, anonymization=True)
+        parsed_fields = Fields(fields, obj.__class__) if not isinstance(fields, Fields) else fields
+        with self.query_budget_guard(obj):
+            self.prefetch_related_objects((obj,), parsed_fields)
+            self.update_obj(obj, legal_reason, purpose, parsed_fields, base_encryption_key, anonymization=True)
 
     def deanonymize_obj(self, obj, fields = u'__ALL__',
                         base_encryption_key = None):
-
-        self.update_obj(obj, fields=fields, base_encryption_key=base_encryption_key, anonymization=False)
+        parsed_fields = Fields(fields, obj.__class__) if not isinstance(fields, Fields) else fields
+        with self.query_budget_guard(obj):
+            self.prefetch_related_objects((obj,), parsed_fields)
+            self.update_obj(obj, fields=parsed_fields, base_encryption_key=base_encryption_key, anonymization=False)
 
 
 class ModelAnonymizer(ModelAnonymizerBase):
     u"""
-    Default model anonymizer that supports anonymization per object.
+    Default model anonymizer that supports anonymization per object and per queryset.
     Child must define Meta class with model (like factoryboy)
     """
 
-    can_anonymize_qs = False
+    can_anonymize_qs = True
     chunk_size = 10000
 
+    def update_objs(self, objs, parsed_fields, legal_reason = None,
+                    purpose = None, anonymization = True):
+        u"""
+        Anonymize (or deanonymize) list of objects of the anonymizer model at once.
+
+        Anonymized values are computed in memory and written with one bulk update per set of updated fields,
+        AnonymizedData records are written in bulk too.
+        """
+        with get_instrumentation().span(u'update_objs', **get_tags(self.model, purpose)):
+            self._update_objs(objs, parsed_fields, legal_reason, purpose, anonymization)
+
+    def _update_objs(self, objs, parsed_fields, legal_reason = None,
+                     purpose = None, anonymization = True):
+        if parsed_fields.local_fields:
+            self.preload_anonymized_fields(objs)
+
+        db_expressions = self.get_db_expressions(parsed_fields, anonymization)
+        fields_count = 0
+        objs_by_fields = {}
+        for obj in objs:
+            if not anonymization and not self.is_reversible(obj):
+                raise self.IrreversibleAnonymizerException(
+                    u'{} for obj "{}" is not reversible.'.format(self.__class__.__name__, obj))
+
+            raw_local_fields = self.get_raw_local_fields(obj, parsed_fields, anonymization)
+            if not raw_local_fields:
+                continue
+            use_db_expressions = db_expressions and not self.anonymize_reversion(obj)
+            python_fields = [i for i in raw_local_fields if not use_db_expressions or i not in db_expressions]
+            update_dict = self.get_update_data(obj, python_fields, anonymization)
+            if self.anonymize_reversion(obj):
+                self.update_versions(obj, raw_local_fields, anonymization)
+            for field_name, value in update_dict.items():
+                setattr(obj, field_name, value)
+            objs_by_fields.setdefault((tuple(sorted(raw_local_fields)), tuple(sorted(python_fields))), []).append(obj)
+            fields_count += len(raw_local_fields)
+
+        for (field_names, python_field_names), updated_objs in objs_by_fields.items():
+            bulk_update(updated_objs, python_field_names)
+            db_field_names = [i for i in field_names if i not in python_field_names]
+            if db_field_names:
+                for objs_chunk in chunked(updated_objs, self.lookup_chunk_size):
+                    self.model._base_manager.filter(pk__in=[obj.pk for obj in objs_chunk]).update(
+                        **dict((name, db_expressions[name]) for name in db_field_names)
+                    )
+                for obj in updated_objs:
+                    # Values computed by the database are loaded again on access
+                    for name in db_field_names:
+                        obj.__dict__.pop(self.model._meta.get_field(name).attname, None)
+            self.bulk_update_fields_as_anonymized(
+                [(obj, field_names) for obj in updated_objs], legal_reason, anonymization=anonymization
+            )
+
+        get_instrumentation().increment(
+            u'fields_anonymized' if anonymization else u'fields_deanonymized', fields_count,
+            **get_tags(self.model, purpose)
+        )
+
+        for obj in objs:
+            self.update_related_fields(parsed_fields, obj, legal_reason, purpose, anonymization)
+
+    def get_db_expressions(self, parsed_fields, anonymization = True):
+        u"""
+        Get database expressions of local fields which can be anonymized in the database without loading values.
+
+        Fields with related fields to anonymize are excluded because encryption keys of related objects are derived
+        from the anonymized values.
+
+        Returns:
+            Dictionary with field name keys and expression values
+        """
+        if not anonymization or parsed_fields.related_fields:
+            return {}
+        connection = connections[router.db_for_write(self.model)]
+        db_expressions = {}
+        for name in parsed_fields.local_fields:
+            field = self.get(name)
+            expression = field.get_db_expression(name, connection) if field is not None else None
+            if expression is not None:
+                db_expressions[name] = expression
+        return db_expressions
+
+    def update_qs(self, qs, legal_reason = None,
+                  purpose = None,
+                  fields = u'__ALL__',
+                  base_encryption_key = None,
+                  anonymization = True):
+        u"""Update queryset in chunks of `chunk_size` objects ordered by primary key, every chunk in a transaction."""
+        if base_encryption_key:
+            self._base_encryption_key = base_encryption_key
+
+        parsed_fields = Fields(fields, self.model, self) if not isinstance(fields, Fields) else fields
+        select_lookups, prefetch_lookups = parsed_fields.get_related_lookups()
+
+        last_pk = None
+        while True:
+            chunk_qs = qs.order_by(u'pk')
+            if select_lookups:
+                chunk_qs = chunk_qs.select_related(*select_lookups)
+            if last_pk is not None:
+                chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+            objs = list(chunk_qs[:self.chunk_size].iterator())
+            if not objs:
+                return
+            # QuerySet.iterator() ignores prefetch_related
+            if prefetch_lookups:
+                prefetch_related_objects(objs, *prefetch_lookups)
+            with transaction.atomic():
+                self.update_objs(objs, parsed_fields, legal_reason, purpose, anonymization)
+            last_pk = objs[-1].pk
+
+    def anonymize_qs(self, qs, fields = u'__ALL__',
+                     legal_reason = None,
+                     purpose = None,
+                     base_encryption_key = None):
+        self.update_qs(qs, legal_reason, purpose, fields, base_encryption_key, anonymization=True)
+
+    def deanonymize_qs(self, qs, fields = u'__ALL__',
+                       base_encryption_key = None):
+        self.update_qs(qs, fields=fields, base_encryption_key=base_encryption_key, anonymization=False)
+
 
 class DeleteModelAnonymizer(ModelAnonymizer):
     u"""
@@ -424,10 +829,15 @@ class DeleteModelAnonymizer(ModelAnonymizer):
                 get_reversion_versions(obj).delete()
 
         elif self.DELETE_FIELD_NAME in parsed_fields.local_fields:
-            parsed_fields.local_fields = [i for i in parsed_fields.local_fields if i != self.DELETE_FIELD_NAME]
+            parsed_fields = parsed_fields.copy(
+                local_fields=[i for i in parsed_fields.local_fields if i != self.DELETE_FIELD_NAME]
+            )
             super(DeleteModelAnonymizer, self).update_obj(obj, legal_reason, purpose, parsed_fields, base_encryption_key, anonymization)
         else:
             super(DeleteModelAnonymizer, self).update_obj(obj, legal_reason, purpose, parsed_fields, base_encryption_key, anonymization)
 
-    def anonymize_qs(self, qs):
+    def anonymize_qs(self, qs, fields = u'__ALL__',
+                     legal_reason = None,
+                     purpose = None,
+                     base_encryption_key = None):
         qs.delete()
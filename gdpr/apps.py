@@ -0,0 +1,23 @@
+from __future__ import absolute_import
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models.signals import post_migrate
+
+
+class GDPRConfig(AppConfig):
+    name = u'gdpr'
+    verbose_name = u'GDPR'
+
+    def ready(self):
+        from gdpr.content_types import clear_content_type_cache, warm_content_type_cache
+
+        # Content types can be created or removed by migrations of any app
+        post_migrate.connect(clear_content_type_cache, dispatch_uid=u'gdpr_clear_content_type_cache')
+        if getattr(settings, u'GDPR_WARM_CONTENT_TYPE_CACHE', True):
+            try:
+                warm_content_type_cache()
+            except DatabaseError:
+                # Database is not migrated yet, content types are resolved on first use
+                clear_content_type_cache()
@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+
+from django.contrib.contenttypes.models import ContentType
+
+_content_type_ids = {}
+_content_type_models = {}
+
+
+def warm_content_type_cache(models=None):
+    u"""
+    Resolve content type ids of models with one query.
+
+    Args:
+        models: Models to resolve, defaults to all models in anonymizer_register
+    """
+    from gdpr.loading import anonymizer_register
+
+    models = [model for model in (models if models is not None else anonymizer_register.keys())
+              if model not in _content_type_ids]
+    if models:
+        for model, content_type in ContentType.objects.get_for_models(*models).items():
+            _content_type_ids[model] = content_type.pk
+            _content_type_models.setdefault(content_type.pk, model._meta.concrete_model)
+
+
+def clear_content_type_cache(**kwargs):
+    u"""Forget resolved content type ids, content types can change e.g. with migrations."""
+    _content_type_ids.clear()
+    _content_type_models.clear()
+
+
+def get_content_type_id(model):
+    u"""
+    Get id of the content type of the concrete model, the same as `ContentType.objects.get_for_model(model).pk`.
+
+    Ids of all models in anonymizer_register are resolved with one query on first use.
+    """
+    if model not in _content_type_ids:
+        warm_content_type_cache()
+    if model not in _content_type_ids:
+        warm_content_type_cache((model,))
+    return _content_type_ids[model]
+
+
+def get_content_type(model):
+    u"""Get content type of the concrete model from the content type cache."""
+    return ContentType.objects.get_for_id(get_content_type_id(model))
+
+
+def get_model_for_content_type_id(content_type_id):
+    u"""Get model class of the content type id."""
+    if content_type_id not in _content_type_models:
+        _content_type_models[content_type_id] = ContentType.objects.get_for_id(content_type_id).model_class()
+    return _content_type_models[content_type_id]
@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_KEY_CACHE_SIZE = 10000
+
+
+class LRUCache(object):
+    u"""Thread safe dictionary keeping at most `maxsize` recently used items."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_settings_key = []
+_caches = {}
+
+
+def _get_cache(name):
+    if name not in _caches:
+        _caches[name] = LRUCache(getattr(settings, u'GDPR_ENCRYPTION_KEY_CACHE_SIZE', DEFAULT_KEY_CACHE_SIZE))
+    return _caches[name]
+
+
+def get_settings_encryption_key():
+    u"""Get settings.GDPR_KEY or settings.SECRET_KEY, resolved once."""
+    if not _settings_key:
+        _settings_key.append(settings.GDPR_KEY if hasattr(settings, u'GDPR_KEY') else settings.SECRET_KEY)
+    return _settings_key[0]
+
+
+def clear_encryption_key_cache():
+    del _settings_key[:]
+    _caches.clear()
+
+
+@receiver(setting_changed)
+def _clear_encryption_key_cache_on_setting_changed(setting, **kwargs):
+    if setting in (u'GDPR_KEY', u'SECRET_KEY', u'GDPR_ENCRYPTION_KEY_CACHE_SIZE'):
+        clear_encryption_key_cache()
+
+
+def derive_encryption_key(object_key, field_name, cache=True):
+    u"""
+    Get hex SHA-256 of `u'{object_key}::{field_name}'`.
+
+    Hash state of the object key is computed once and copied for every field, derived keys are kept in LRU cache.
+
+    Args:
+        object_key: Encryption key of the object
+        field_name: Name of the field to derive encryption key for
+        cache: Set False for one-off keys (e.g. random keys of irreversible anonymization) to keep them out of cache
+    """
+    if not cache:
+        return hashlib.sha256(u'{}::{}'.format(object_key, field_name).encode(u'utf-8')).hexdigest()
+
+    field_keys, object_key_hashes = _get_cache(u'field_keys'), _get_cache(u'object_key_hashes')
+    key = (object_key, field_name)
+    field_key = field_keys.get(key)
+    if field_key is None:
+        object_key_hash = object_key_hashes.get(object_key)
+        if object_key_hash is None:
+            object_key_hash = hashlib.sha256(u'{}::'.format(object_key).encode(u'utf-8'))
+            object_key_hashes.set(object_key, object_key_hash)
+        field_key_hash = object_key_hash.copy()
+        field_key_hash.update(u'{}'.format(field_name).encode(u'utf-8'))
+        field_key = field_key_hash.hexdigest()
+        field_keys.set(key, field_key)
+    return field_key
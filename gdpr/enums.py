@@ -1,9 +1,21 @@
 from __future__ import absolute_import
 
-from enum import IntEnum
+from enum import Enum, IntEnum
 
 
 class LegalReasonState(IntEnum):
     ACTIVE = 1
     EXPIRED = 2
     DEACTIVATED = 3
+
+
+class AnonymizationUpdateMode(Enum):
+    SAVE = u'save'
+    UPDATE_FIELDS = u'update_fields'
+    QUERYSET = u'queryset'
+
+
+class AnonymizationJobState(IntEnum):
+    PENDING = 1
+    DONE = 2
+    FAILED = 3
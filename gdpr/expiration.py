@@ -0,0 +1,392 @@
+# -*- coding: future_fstrings -*-
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import math
+import multiprocessing
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from gdpr.content_types import get_model_for_content_type_id, warm_content_type_cache
+from gdpr.enums import LegalReasonState
+from gdpr.instrumentation import get_instrumentation
+from gdpr.loading import anonymizer_register, purpose_register
+from gdpr.utils import get_object_id_filter
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_SHARD_SIZE = 10000
+
+ExpirationShard = namedtuple(u'ExpirationShard', (u'content_type_id', u'pk_from', u'pk_to'))
+
+
+class ExpirationReport(object):
+    u"""
+    Result of an expiration run.
+
+    Args:
+        expired: Number of legal reasons which were anonymized and expired
+        failed: List of (legal reason pk, error message) tuples of legal reasons which could not be expired
+    """
+
+    def __init__(self, expired=0, failed=None):
+        self.expired = expired
+        self.failed = list(failed or [])
+
+    def __repr__(self):
+        return u'<ExpirationReport expired={} failed={}>'.format(self.expired, len(self.failed))
+
+    def merge(self, other):
+        self.expired += other.expired
+        self.failed += other.failed
+        return self
+
+
+class ExpirationEngine(object):
+    u"""
+    Anonymize and expire active legal reasons which have past their `expires_at` in chunks.
+
+    Legal reasons are paged by primary key, source objects of every chunk are loaded with one query per content type
+    and all legal reasons of the chunk are marked as expired with a single UPDATE. Every source object is anonymized
+    in its own transaction.
+    """
+
+    def __init__(self, queryset=None, chunk_size=None, fail_silently=False, checkpoint=None):
+        u"""
+        Args:
+            queryset: LegalReason queryset to expire, defaults to all legal reasons
+            chunk_size: Number of legal reasons processed at once, defaults to settings.GDPR_EXPIRATION_CHUNK_SIZE
+            fail_silently: If True errors are stored to the report instead of being raised
+            checkpoint: ExpirationCheckpoint the progress is stored to after every chunk, legal reasons up to its
+                `last_pk` are skipped
+        """
+        from gdpr.models import LegalReason
+
+        self.queryset = queryset if queryset is not None else LegalReason.objects.all()
+        self.chunk_size = chunk_size or getattr(settings, u'GDPR_EXPIRATION_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        self.fail_silently = fail_silently
+        self.checkpoint = checkpoint
+
+    def get_queryset(self):
+        return self.queryset.filter_active_and_expired().order_by(u'pk')
+
+    def iter_chunks(self):
+        u"""Yield lists of legal reasons to expire, ordered by primary key."""
+        last_pk = self.checkpoint.last_pk if self.checkpoint else None
+        while True:
+            qs = self.get_queryset()
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            chunk = list(qs[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def get_source_objects(self, legal_reasons):
+        u"""
+        Load source objects of legal reasons with one query per content type.
+
+        Returns:
+            Dictionary with (content type id, source object id) keys and source object values
+        """
+        object_ids = OrderedDict()
+        for legal_reason in legal_reasons:
+            object_ids.setdefault(legal_reason.source_object_content_type_id, set()).add(legal_reason.source_object_id)
+
+        source_objects = {}
+        for content_type_id, ids in object_ids.items():
+            model = get_model_for_content_type_id(content_type_id)
+            for obj in model._base_manager.filter(pk__in=list(ids)):
+                source_objects[(content_type_id, force_text(obj.pk))] = obj
+        return source_objects
+
+    def get_object_legal_reasons(self, legal_reasons):
+        u"""
+        Load all active legal reasons of source objects of `legal_reasons` with one query per content type.
+
+        Returns:
+            Tuple of two dictionaries with (content type id, source object id) keys, the first with lists of legal
+            reasons to expire (including those out of the chunk), the second with sets of purpose slugs of the other
+            active legal reasons
+        """
+        from gdpr.models import LegalReason
+
+        object_ids = OrderedDict()
+        for legal_reason in legal_reasons:
+            object_ids.setdefault(legal_reason.source_object_content_type_id, set()).add(legal_reason.source_object_id)
+
+        now = timezone.now()
+        expiring_legal_reasons = OrderedDict()
+        other_purpose_slugs = {}
+        for content_type_id, ids in object_ids.items():
+            for legal_reason in LegalReason.objects.filter_active().filter(
+                    source_object_content_type_id=content_type_id,
+                    **get_object_id_filter(u'source_object_id', get_model_for_content_type_id(content_type_id),
+                                           list(ids))
+            ).order_by(u'pk'):
+                key = (legal_reason.source_object_content_type_id, legal_reason.source_object_id)
+                other_purpose_slugs.setdefault(key, set())
+                if legal_reason.expires_at is not None and legal_reason.expires_at <= now:
+                    expiring_legal_reasons.setdefault(key, []).append(legal_reason)
+                else:
+                    other_purpose_slugs[key].add(legal_reason.purpose_slug)
+        return expiring_legal_reasons, other_purpose_slugs
+
+    def get_anonymizers(self, source_objects):
+        u"""
+        Create one anonymizer per model with preloaded anonymized fields of all source objects of the chunk.
+
+        Returns:
+            Dictionary with model keys and anonymizer values
+        """
+        objs_by_model = OrderedDict()
+        for obj in source_objects:
+            objs_by_model.setdefault(obj.__class__, []).append(obj)
+
+        anonymizers = {}
+        for model, objs in objs_by_model.items():
+            if model in anonymizer_register:
+                anonymizers[model] = anonymizer_register[model]()
+                anonymizers[model].preload_anonymized_fields(objs)
+        return anonymizers
+
+    def prefetch_related_objects(self, legal_reasons, source_objects, anonymizers):
+        u"""Load related objects to anonymize of all source objects of the chunk, per model and purpose."""
+        objs_by_purpose = OrderedDict()
+        for legal_reason in legal_reasons:
+            source_object = source_objects.get((legal_reason.source_object_content_type_id,
+                                                legal_reason.source_object_id))
+            if source_object is not None and legal_reason.purpose_slug in purpose_register:
+                objs_by_purpose.setdefault((source_object.__class__, legal_reason.purpose_slug), []).append(
+                    source_object
+                )
+
+        for (model, purpose_slug), objs in objs_by_purpose.items():
+            if model in anonymizers:
+                anonymizers[model].prefetch_related_objects(
+                    objs, purpose_register[purpose_slug]().get_parsed_fields(model)
+                )
+
+    def anonymize_source_object(self, source_object, legal_reasons, excluded_legal_reasons, lock=False,
+                                anonymizer=None, other_purpose_slugs=None):
+        u"""
+        Anonymize source object according to purposes of its expired legal reasons.
+
+        Args:
+            source_object: Object to anonymize
+            legal_reasons: Legal reasons of the chunk to anonymize source object for
+            excluded_legal_reasons: All legal reasons of source object which expire in this run
+            lock: If True source object is locked and reloaded first because other legal reasons of the object can be
+                expired concurrently
+            anonymizer: Anonymizer of the source object model with preloaded anonymized fields
+            other_purpose_slugs: Purpose slugs of the other active legal reasons of source object
+        """
+        with transaction.atomic():
+            if lock:
+                source_object = source_object.__class__._base_manager.select_for_update().get(pk=source_object.pk)
+                # Preloaded anonymized fields and other legal reasons could be changed by the concurrent expiration
+                anonymizer = None
+                other_purpose_slugs = None
+            for legal_reason in legal_reasons:
+                purpose_register[legal_reason.purpose_slug]().anonymize_obj(
+                    source_object, legal_reason, excluded_legal_reasons=excluded_legal_reasons, anonymizer=anonymizer,
+                    other_purpose_slugs=other_purpose_slugs
+                )
+
+    def expire_legal_reasons(self, pks):
+        from gdpr.models import LegalReason
+
+        if pks:
+            LegalReason.objects.filter(pk__in=pks).update(state=LegalReasonState.EXPIRED, changed_at=timezone.now())
+
+    def process_chunk(self, legal_reasons, report):
+        source_objects = self.get_source_objects(legal_reasons)
+        expiring_legal_reasons, other_purpose_slugs = self.get_object_legal_reasons(legal_reasons)
+        anonymizers = self.get_anonymizers(source_objects.values())
+        self.prefetch_related_objects(legal_reasons, source_objects, anonymizers)
+
+        legal_reasons_by_object = OrderedDict()
+        for legal_reason in legal_reasons:
+            key = (legal_reason.source_object_content_type_id, legal_reason.source_object_id)
+            legal_reasons_by_object.setdefault(key, []).append(legal_reason)
+
+        expired_pks = []
+        try:
+            for key, object_legal_reasons in legal_reasons_by_object.items():
+                source_object = source_objects.get(key)
+                excluded_legal_reasons = expiring_legal_reasons.get(key, object_legal_reasons)
+                try:
+                    # Legal reasons of already removed objects are just expired
+                    if source_object is not None:
+                        self.anonymize_source_object(
+                            source_object, object_legal_reasons, excluded_legal_reasons,
+                            lock=len(excluded_legal_reasons) > len(object_legal_reasons),
+                            anonymizer=anonymizers.get(source_object.__class__),
+                            other_purpose_slugs=other_purpose_slugs.get(key)
+                        )
+                except Exception, ex:
+                    if not self.fail_silently:
+                        raise
+                    report.failed += [(legal_reason.pk, force_text(ex)) for legal_reason in object_legal_reasons]
+                else:
+                    expired_pks += [legal_reason.pk for legal_reason in object_legal_reasons]
+        finally:
+            self.expire_legal_reasons(expired_pks)
+            report.expired += len(expired_pks)
+            expired_pks_set = set(expired_pks)
+            expired_purposes = Counter(
+                legal_reason.purpose_slug for legal_reason in legal_reasons if legal_reason.pk in expired_pks_set
+            )
+            for purpose_slug, count in expired_purposes.items():
+                get_instrumentation().increment(u'legal_reasons_expired', count, purpose=purpose_slug)
+
+    def run(self, report=None):
+        u"""
+        Args:
+            report: ExpirationReport the results are added to, a new one is created if not set. Results of processed
+                chunks are kept in it if the run raises an exception.
+        """
+        report = report if report is not None else ExpirationReport()
+        if self.checkpoint and self.checkpoint.is_finished:
+            return report
+        for chunk in self.iter_chunks():
+            chunk_report = ExpirationReport()
+            try:
+                with get_instrumentation().span(u'expiration_chunk'):
+                    self.process_chunk(chunk, chunk_report)
+            finally:
+                report.merge(chunk_report)
+            if self.checkpoint:
+                self.checkpoint.save_progress(chunk[-1].pk, chunk_report)
+        if self.checkpoint:
+            self.checkpoint.finish()
+        return report
+
+
+def _expire_shard(args):
+    u"""Expire legal reasons of one shard, run in a worker process."""
+    from gdpr.models import ExpirationCheckpoint, LegalReason
+
+    query, shard, chunk_size, checkpoint_pk = args
+    report = ExpirationReport()
+    try:
+        # Queryset of the runner is narrowed to the shard, query is sent to workers because pickled querysets are
+        # evaluated
+        queryset = LegalReason.objects.all()
+        queryset.query = query
+        queryset = queryset.filter(
+            source_object_content_type_id=shard.content_type_id, pk__range=(shard.pk_from, shard.pk_to)
+        )
+        checkpoint = ExpirationCheckpoint.objects.get(pk=checkpoint_pk) if checkpoint_pk is not None else None
+        ExpirationEngine(queryset, chunk_size=chunk_size, fail_silently=True, checkpoint=checkpoint).run(report)
+    except Exception, ex:
+        # Legal reasons expired by the already processed chunks are reported too
+        report.failed.append((None, u'Shard {} failed: {}'.format(tuple(shard), force_text(ex))))
+    return report.expired, report.failed
+
+
+def init_worker():
+    u"""Initializer of worker processes, every worker process must open its own database connection."""
+    connections.close_all()
+
+
+class ParallelExpirationRunner(object):
+    u"""
+    Expire legal reasons in worker processes.
+
+    Legal reasons to expire are split into disjoint shards by source object content type and primary key range, every
+    shard is expired by `ExpirationEngine` in a worker process with its own database connection and reports of all
+    shards are merged. Source objects are still anonymized one transaction per object.
+
+    Worker processes are used only outside of a transaction (RuntimeError is raised otherwise) because connections of
+    the calling process are closed before forking.
+
+    If `run_id` is set, shards are stored as ExpirationCheckpoint records on the first run and a restarted run with the
+    same `run_id` continues every unfinished shard after its last processed chunk.
+    """
+
+    def __init__(self, queryset=None, workers=None, shard_size=None, chunk_size=None, run_id=None):
+        u"""
+        Args:
+            queryset: LegalReason queryset to expire, defaults to all legal reasons
+            workers: Number of worker processes, defaults to settings.GDPR_EXPIRATION_WORKERS or number of CPUs
+            shard_size: Approximate number of legal reasons in one shard, defaults to
+                settings.GDPR_EXPIRATION_SHARD_SIZE
+            chunk_size: Number of legal reasons processed at once in a worker
+            run_id: Identifier of the run whose progress is stored to checkpoints, progress is not stored if not set
+        """
+        from gdpr.models import LegalReason
+
+        self.queryset = queryset if queryset is not None else LegalReason.objects.all()
+        self.workers = workers or getattr(settings, u'GDPR_EXPIRATION_WORKERS', None) or multiprocessing.cpu_count()
+        self.shard_size = shard_size or getattr(settings, u'GDPR_EXPIRATION_SHARD_SIZE', DEFAULT_SHARD_SIZE)
+        self.chunk_size = chunk_size
+        self.run_id = run_id
+
+    def get_queryset(self):
+        return self.queryset.filter_active_and_expired()
+
+    def get_shards(self):
+        u"""Split legal reasons to expire into disjoint shards of approximately `shard_size` legal reasons."""
+        shards = []
+        stats = self.get_queryset().order_by().values(u'source_object_content_type').annotate(
+            min_pk=Min(u'pk'), max_pk=Max(u'pk'), count=Count(u'pk')
+        ).order_by(u'source_object_content_type')
+        for row in stats:
+            shards_count = int(math.ceil(float(row[u'count']) / self.shard_size))
+            step = int(math.ceil(float(row[u'max_pk'] - row[u'min_pk'] + 1) / shards_count))
+            for pk_from in range(row[u'min_pk'], row[u'max_pk'] + 1, step):
+                shards.append(ExpirationShard(
+                    row[u'source_object_content_type'], pk_from, min(pk_from + step - 1, row[u'max_pk'])
+                ))
+        return shards
+
+    def get_checkpoints(self):
+        u"""Get checkpoints of unfinished shards of the run, shards are computed and stored by the first run."""
+        from gdpr.models import ExpirationCheckpoint
+
+        checkpoints = ExpirationCheckpoint.objects.filter(run_id=self.run_id)
+        if not checkpoints.exists():
+            ExpirationCheckpoint.objects.bulk_create([
+                ExpirationCheckpoint(
+                    run_id=self.run_id, source_object_content_type_id=shard.content_type_id, pk_from=shard.pk_from,
+                    pk_to=shard.pk_to
+                ) for shard in self.get_shards()
+            ])
+        return list(checkpoints.filter(is_finished=False).order_by(u'pk'))
+
+    def run(self):
+        if self.run_id is None:
+            tasks = [(self.queryset.query, shard, self.chunk_size, None) for shard in self.get_shards()]
+        else:
+            tasks = [
+                (self.queryset.query,
+                 ExpirationShard(checkpoint.source_object_content_type_id, checkpoint.pk_from, checkpoint.pk_to),
+                 self.chunk_size, checkpoint.pk)
+                for checkpoint in self.get_checkpoints()
+            ]
+        if self.workers <= 1 or len(tasks) <= 1:
+            results = [_expire_shard(task) for task in tasks]
+        else:
+            if any(connection.in_atomic_block for connection in connections.all()):
+                # Connections are closed before forking, it would break the transaction of the caller
+                raise RuntimeError(u'Legal reasons cannot be expired in worker processes inside a transaction.')
+            # Forked workers inherit resolved content types but must not share connections of the parent process
+            warm_content_type_cache()
+            connections.close_all()
+            pool = multiprocessing.Pool(min(self.workers, len(tasks)), initializer=init_worker)
+            try:
+                results = pool.map(_expire_shard, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        report = ExpirationReport()
+        for expired, failed in results:
+            report.merge(ExpirationReport(expired, failed))
+        return report
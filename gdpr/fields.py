@@ -1,6 +1,52 @@
 from __future__ import absolute_import
 
+import threading
+
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.fields.reverse_related import OneToOneRel
+
 from gdpr.loading import anonymizer_register
+from gdpr.utils import get_field_or_none
+
+
+_cache = threading.local()
+
+
+def get_cached_fields(key, fields, model):
+    u"""
+    Get Fields parsed from fields matrix, parsed only once per thread for the key.
+
+    Only the parsed tree is cached, every call gets a copy of the tree with new anonymizer instances (see `get_cached`).
+
+    Args:
+        key: Hashable key of the fields matrix, e.g. (purpose slug, model)
+        fields: Fields matrix
+        model: Model of the fields matrix
+    """
+    return get_cached(key, lambda: Fields(fields, model))
+
+
+def get_cached(key, get_fields):
+    u"""
+    Get Fields returned by `get_fields`, called only once per thread for the key.
+
+    Anonymizer instances keep the state of an anonymization (e.g. preloaded anonymized fields or the base encryption
+    key), therefore the cached tree is never returned, every call gets its copy with new anonymizer instances.
+
+    Args:
+        key: Hashable key of the Fields
+        get_fields: Callable without arguments returning the Fields
+    """
+    cache = getattr(_cache, u'fields', None)
+    if cache is None:
+        cache = _cache.fields = {}
+    if key not in cache:
+        cache[key] = get_fields()
+    return cache[key].copy_with_new_anonymizers()
+
+
+def clear_fields_cache():
+    _cache.fields = {}
 
 
 class Fields(object):
@@ -11,6 +57,30 @@ class Fields(object):
         self.local_fields = self.parse_local_fields(fields)
         self.related_fields = self.parse_related_fields(fields)
 
+    @classmethod
+    def _from_parsed(cls, model, anonymizer, local_fields, related_fields):
+        fields = cls.__new__(cls)
+        fields.model = model
+        fields.anonymizer = anonymizer
+        fields.local_fields = local_fields
+        fields.related_fields = related_fields
+        return fields
+
+    def copy(self, local_fields = None, related_fields = None):
+        u"""Get new Fields sharing the anonymizer with replaced local or related fields."""
+        return self._from_parsed(
+            self.model, self.anonymizer,
+            list(self.local_fields if local_fields is None else local_fields),
+            dict(self.related_fields if related_fields is None else related_fields)
+        )
+
+    def copy_with_new_anonymizers(self):
+        u"""Get copy of the whole Fields tree with new anonymizer instances, parsed fields are not parsed again."""
+        return self._from_parsed(
+            self.model, type(self.anonymizer)(), list(self.local_fields),
+            {name: fields.copy_with_new_anonymizers() for name, fields in self.related_fields.items()}
+        )
+
     def parse_local_fields(self, fields):
         u"""Get Iterable of local fields from fields matrix."""
         if fields == u'__ALL__' or (u'__ALL__' in fields and type(fields) not in (unicode, str)):
@@ -26,6 +96,37 @@ class Fields(object):
 
         return out_dict
 
+    def get_related_lookups(self, prefix = u'', select_related = True):
+        u"""
+        Get lookups which load all related objects of the fields tree with one query per relation level.
+
+        Chains of foreign keys and one to one relations starting at the model can be joined with `select_related`,
+        other relations have to be loaded with `prefetch_related`. Objects of generic relations defined by
+        RelationAnonymizer are not included.
+
+        Returns:
+            Tuple of (select_related lookups, prefetch_related lookups)
+        """
+        select_lookups, prefetch_lookups = [], []
+        for name, related_fields in self.related_fields.items():
+            field = get_field_or_none(self.model, name)
+            if field is None:
+                continue
+            lookup = prefix + name
+            is_joinable = select_related and (field.many_to_one or field.one_to_one) and (
+                field.concrete or isinstance(field, OneToOneRel)
+            )
+            if is_joinable:
+                select_lookups.append(lookup)
+            else:
+                prefetch_lookups.append(lookup)
+            related_select_lookups, related_prefetch_lookups = related_fields.get_related_lookups(
+                lookup + LOOKUP_SEP, is_joinable
+            )
+            select_lookups += related_select_lookups
+            prefetch_lookups += related_prefetch_lookups
+        return select_lookups, prefetch_lookups
+
     def get_tuple(self):
         l1 = self.local_fields
         l2 = [(name, fields.get_tuple()) for name, fields in self.related_fields.items()]
@@ -34,15 +135,19 @@ class Fields(object):
     def __len__(self):
         return len(self.local_fields) + len(self.related_fields)
 
-    def __isub__(self, other):
-        self.local_fields = [field for field in self.local_fields if field not in other.local_fields]
-
-        for name, related_fields in self.related_fields.items():
+    def __sub__(self, other):
+        u"""Get new Fields without fields of `other`, self is not changed because it can be cached."""
+        related_fields = {}
+        for name, fields in self.related_fields.items():
             if name in other.related_fields:
-                related_fields -= other.related_fields[name]
+                fields = fields - other.related_fields[name]
+            if len(fields) != 0:
+                related_fields[name] = fields
 
-        for name in list(self.related_fields.keys()):
-            if len(self.related_fields[name]) == 0:
-                del self.related_fields[name]
+        return self.copy(
+            local_fields=[field for field in self.local_fields if field not in other.local_fields],
+            related_fields=related_fields
+        )
 
-        return self
+    def __isub__(self, other):
+        return self - other
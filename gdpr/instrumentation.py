@@ -0,0 +1,186 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from gdpr.utils import count_queries, str_to_class
+
+DEFAULT_INSTRUMENTATION = u'gdpr.instrumentation.Instrumentation'
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def get_tags(model=None, purpose=None):
+    u"""Get tags of the model (`app_label.ModelName`) and purpose (slug) used by the anonymization hooks."""
+    tags = {}
+    if model is not None:
+        tags[u'model'] = model._meta.label
+    if purpose is not None:
+        tags[u'purpose'] = purpose.slug or u''
+    return tags
+
+
+class Instrumentation(object):
+    u"""
+    Instrumentation hooks of anonymization, this default implementation does nothing.
+
+    Spans time phases (e.g. `update_obj`, `hashing`, `db_write`, `reversion`, `related`, `expire`), counters count
+    work (e.g. `fields_anonymized`, `versions_rewritten`, `bytes_serialized`). Both are tagged with model and purpose
+    where they are known.
+    """
+
+    def span(self, phase, **tags):
+        u"""Get context manager timing the phase."""
+        return _null_span
+
+    def increment(self, name, value=1, **tags):
+        u"""Add value to the counter."""
+
+
+class InMemoryInstrumentation(Instrumentation):
+    u"""
+    Instrumentation collecting counters and span timings in the process memory.
+
+    Collected metrics are rendered in Prometheus text format with `render_prometheus` (e.g. by
+    `prometheus_metrics_view`) or as StatsD lines with DogStatsD tags with `render_statsd`. Database queries issued in
+    every span are counted with the `queries` counter if `count_queries` is True.
+    """
+
+    count_queries = False
+
+    def __init__(self, count_queries=None):
+        u"""
+        Args:
+            count_queries: Count database queries of spans, defaults to the `count_queries` class attribute
+        """
+        if count_queries is not None:
+            self.count_queries = count_queries
+        self._lock = threading.Lock()
+        self.counters = OrderedDict()
+        self.spans = OrderedDict()
+
+    @staticmethod
+    def _get_key(name, tags):
+        return name, tuple(sorted(tags.items()))
+
+    def increment(self, name, value=1, **tags):
+        key = self._get_key(name, tags)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_span(self, phase, seconds, **tags):
+        key = self._get_key(phase, tags)
+        with self._lock:
+            count, total = self.spans.get(key, (0, 0.0))
+            self.spans[key] = (count + 1, total + seconds)
+
+    @contextmanager
+    def span(self, phase, **tags):
+        start = time.time()
+        try:
+            if self.count_queries:
+                with count_queries() as queries:
+                    yield
+                self.increment(u'queries', queries.count, phase=phase, **tags)
+            else:
+                yield
+        finally:
+            self.add_span(phase, time.time() - start, **tags)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.spans.clear()
+
+    @staticmethod
+    def _render_prometheus_labels(tags):
+        if not tags:
+            return u''
+        return u'{{{}}}'.format(u','.join(
+            u'{}="{}"'.format(name, u'{}'.format(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(
+                u'\n', u'\\n'))
+            for name, value in tags
+        ))
+
+    def render_prometheus(self):
+        u"""Render metrics in Prometheus text exposition format."""
+        with self._lock:
+            counters, spans = list(self.counters.items()), list(self.spans.items())
+
+        metrics = OrderedDict()
+        for (name, tags), value in counters:
+            metrics.setdefault((u'gdpr_{}_total'.format(name), u'counter'), []).append(
+                u'gdpr_{}_total{} {}'.format(name, self._render_prometheus_labels(tags), value)
+            )
+        for (phase, tags), (count, total) in spans:
+            labels = self._render_prometheus_labels(((u'phase', phase),) + tags)
+            samples = metrics.setdefault((u'gdpr_span_seconds', u'summary'), [])
+            samples.append(u'gdpr_span_seconds_count{} {}'.format(labels, count))
+            samples.append(u'gdpr_span_seconds_sum{} {!r}'.format(labels, total))
+
+        lines = []
+        for (name, metric_type), samples in metrics.items():
+            lines.append(u'# TYPE {} {}'.format(name, metric_type))
+            lines += samples
+        return u''.join(u'{}\n'.format(line) for line in lines)
+
+    @staticmethod
+    def _render_statsd_tags(tags):
+        return u'|#{}'.format(u','.join(u'{}:{}'.format(name, value) for name, value in tags)) if tags else u''
+
+    def render_statsd(self):
+        u"""
+        Render metrics as StatsD counter lines, spans as `gdpr.span.<phase>.count` and `gdpr.span.<phase>.ms`.
+
+        Values are totals since the last `reset`.
+        """
+        with self._lock:
+            counters, spans = list(self.counters.items()), list(self.spans.items())
+
+        lines = [
+            u'gdpr.{}:{}|c{}'.format(name, value, self._render_statsd_tags(tags)) for (name, tags), value in counters
+        ]
+        for (phase, tags), (count, total) in spans:
+            lines.append(u'gdpr.span.{}.count:{}|c{}'.format(phase, count, self._render_statsd_tags(tags)))
+            lines.append(u'gdpr.span.{}.ms:{}|c{}'.format(phase, int(total * 1000), self._render_statsd_tags(tags)))
+        return lines
+
+
+_instrumentation = []
+
+
+def get_instrumentation():
+    u"""Get instance of settings.GDPR_INSTRUMENTATION, created once per process."""
+    if not _instrumentation:
+        _instrumentation.append(str_to_class(getattr(settings, u'GDPR_INSTRUMENTATION', DEFAULT_INSTRUMENTATION))())
+    return _instrumentation[0]
+
+
+@receiver(setting_changed)
+def _reset_instrumentation(setting, **kwargs):
+    if setting == u'GDPR_INSTRUMENTATION':
+        del _instrumentation[:]
+
+
+def prometheus_metrics_view(request):
+    u"""View rendering metrics of InMemoryInstrumentation to be scraped by Prometheus."""
+    instrumentation = get_instrumentation()
+    content = instrumentation.render_prometheus() if isinstance(instrumentation, InMemoryInstrumentation) else u''
+    return HttpResponse(content, content_type=u'text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+from gdpr.enums import LegalReasonState
+from gdpr.utils import str_to_class
+
+logger = logging.getLogger(u'gdpr')
+
+DEFAULT_BACKEND = u'gdpr.jobs.SyncBackend'
+DEFAULT_THREADS = 4
+
+
+def anonymize_legal_reason(legal_reason):
+    u"""
+    Anonymize source object of the expired or deactivated legal reason.
+
+    Legal reasons which were renewed before the job was run are skipped.
+
+    Returns:
+        True if the source object was anonymized
+    """
+    if legal_reason.state == LegalReasonState.ACTIVE:
+        return False
+    legal_reason._anonymize_obj()
+    return True
+
+
+class BaseBackend(object):
+    u"""Dispatcher of anonymization jobs of expired or deactivated legal reasons."""
+
+    def enqueue(self, legal_reason):
+        raise NotImplementedError
+
+
+class SyncBackend(BaseBackend):
+    u"""Anonymize immediately in the current thread and transaction (default)."""
+
+    def enqueue(self, legal_reason):
+        anonymize_legal_reason(legal_reason)
+
+
+def _run_job(legal_reason_pk):
+    from gdpr.models import LegalReason
+
+    try:
+        with transaction.atomic():
+            legal_reason = LegalReason.objects.select_for_update().filter(pk=legal_reason_pk).first()
+            if legal_reason is not None:
+                anonymize_legal_reason(legal_reason)
+    except Exception:
+        logger.exception(u'Anonymization of legal reason %s failed', legal_reason_pk)
+    finally:
+        # Every pool thread has its own connection
+        connection.close()
+
+
+class ThreadPoolBackend(BaseBackend):
+    u"""
+    Anonymize in a pool of settings.GDPR_ANONYMIZATION_THREADS threads of the current process.
+
+    Jobs are started after the transaction changing the legal reason state is committed, failed jobs are logged only
+    and jobs not finished before the process exits are lost.
+    """
+
+    def __init__(self, threads=None):
+        self.threads = threads or getattr(settings, u'GDPR_ANONYMIZATION_THREADS', DEFAULT_THREADS)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.threads)
+            return self._pool
+
+    def enqueue(self, legal_reason):
+        legal_reason_pk = legal_reason.pk
+        transaction.on_commit(lambda: self.get_pool().apply_async(_run_job, (legal_reason_pk,)))
+
+
+class DatabaseQueueBackend(BaseBackend):
+    u"""
+    Store jobs to AnonymizationJob table in the transaction changing the legal reason state.
+
+    Jobs are processed by `./manage.py gdpr_process_anonymization_jobs`.
+    """
+
+    def enqueue(self, legal_reason):
+        from gdpr.models import AnonymizationJob
+
+        AnonymizationJob.objects.create(legal_reason=legal_reason)
+
+
+_backend = []
+
+
+def get_anonymization_backend():
+    u"""Get instance of settings.GDPR_ANONYMIZATION_BACKEND, created once per process."""
+    if not _backend:
+        _backend.append(str_to_class(getattr(settings, u'GDPR_ANONYMIZATION_BACKEND', DEFAULT_BACKEND))())
+    return _backend[0]
+
+
+@receiver(setting_changed)
+def _reset_anonymization_backend(setting, **kwargs):
+    if setting in (u'GDPR_ANONYMIZATION_BACKEND', u'GDPR_ANONYMIZATION_THREADS'):
+        del _backend[:]
@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+import json
+import multiprocessing
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from gdpr.content_types import warm_content_type_cache
+from gdpr.expiration import init_worker
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _process_chunk(args):
+    u"""Run chunk function of the command, run in a worker process."""
+    function, pks, dry_run, kwargs = args
+    return function(pks, dry_run, **kwargs)
+
+
+class ChunkedMaintenanceCommand(BaseCommand):
+    u"""
+    Base of maintenance commands processing rows of a queryset in chunks ordered by primary key.
+
+    Primary keys of the chunk are passed to `chunk_function(pks, dry_run, **kwargs)` which must be a module level
+    function (set with staticmethod so it can be pickled) returning a tuple of the number of processed rows and a
+    list of (pk, error message) tuples of failed rows. Chunks are processed in worker processes if `--workers` is set.
+    Progress (the last primary key of the processed chunks and counters) is written to `--heartbeat-file` after every
+    chunk so the run can be watched and resumed with `--resume-from`.
+    """
+
+    chunk_function = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(u'--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=u'Number of rows processed at once')
+        parser.add_argument(u'--workers', type=int, default=None,
+                            help=u'Number of worker processes, chunks are processed in the current process if not set')
+        parser.add_argument(u'--limit', type=int, default=None, help=u'Maximal number of processed rows')
+        parser.add_argument(u'--dry-run', action=u'store_true', default=False,
+                            help=u'Only count rows which would be processed')
+        parser.add_argument(u'--resume-from', default=None,
+                            help=u'Process only rows with primary key greater than given value')
+        parser.add_argument(u'--heartbeat-file', default=None, help=u'Path of JSON file the progress is written to')
+        parser.add_argument(u'--sleep', type=float, default=None,
+                            help=u'Number of seconds to sleep after every chunk to throttle the load')
+
+    def get_queryset(self, options):
+        raise NotImplementedError
+
+    def get_chunk_kwargs(self, options):
+        u"""Get additional keyword arguments of `chunk_function`, they must be picklable."""
+        return {}
+
+    def iter_chunks(self, queryset, chunk_size, resume_from=None, limit=None):
+        u"""Yield lists of primary keys of rows to process, ordered by primary key."""
+        queryset = queryset.order_by(u'pk')
+        last_pk = queryset.model._meta.pk.to_python(resume_from) if resume_from is not None else None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            qs = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            pks = list(qs.values_list(u'pk', flat=True)[:size])
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
+            if remaining is not None:
+                remaining -= len(pks)
+
+    def write_heartbeat(self, path, progress):
+        if path:
+            progress[u'updated_at'] = timezone.now().isoformat()
+            tmp_path = u'{}.tmp'.format(path)
+            with open(tmp_path, u'w') as heartbeat_file:
+                json.dump(progress, heartbeat_file)
+            # Readers never see partially written file
+            os.rename(tmp_path, path)
+
+    def handle(self, *args, **options):
+        queryset = self.get_queryset(options)
+        kwargs = self.get_chunk_kwargs(options)
+        workers = options[u'workers'] or 1
+        progress = {
+            u'command': self.__module__.rsplit(u'.', 1)[-1],
+            u'dry_run': options[u'dry_run'],
+            u'started_at': timezone.now().isoformat(),
+            u'last_pk': options[u'resume_from'],
+            u'processed': 0,
+            u'failed': 0,
+            u'finished': False,
+        }
+        self.write_heartbeat(options[u'heartbeat_file'], progress)
+
+        pool = None
+        if workers > 1:
+            # Forked workers inherit resolved content types but must not share connections of the parent process
+            warm_content_type_cache()
+            connections.close_all()
+            pool = multiprocessing.Pool(workers, initializer=init_worker)
+        try:
+            chunks = self.iter_chunks(queryset, options[u'chunk_size'], options[u'resume_from'], options[u'limit'])
+            while True:
+                # Every worker gets one chunk, progress is stored when all of them are done so the last pk is safe
+                # to resume from
+                batch = list(islice(chunks, workers))
+                if not batch:
+                    break
+                tasks = [(self.chunk_function, pks, options[u'dry_run'], kwargs) for pks in batch]
+                results = pool.map(_process_chunk, tasks, chunksize=1) if pool else map(_process_chunk, tasks)
+                for processed, failed in results:
+                    progress[u'processed'] += processed
+                    progress[u'failed'] += len(failed)
+                    for pk, message in failed:
+                        self.stderr.write(u'{} failed: {}'.format(pk, message))
+                progress[u'last_pk'] = force_text(batch[-1][-1])
+                self.write_heartbeat(options[u'heartbeat_file'], progress)
+                if options[u'verbosity'] > 1:
+                    self.stdout.write(u'{processed} processed, {failed} failed, last pk {last_pk}'.format(**progress))
+                if options[u'sleep']:
+                    time.sleep(options[u'sleep'])
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        progress[u'finished'] = True
+        self.write_heartbeat(options[u'heartbeat_file'], progress)
+        self.stdout.write(u'{} {} processed, {} failed'.format(
+            progress[u'processed'], u'would be' if options[u'dry_run'] else u'were', progress[u'failed']
+        ))
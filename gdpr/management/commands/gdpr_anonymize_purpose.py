@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+from django.apps import apps
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils.encoding import force_text
+
+from gdpr.loading import anonymizer_register, purpose_register
+from gdpr.management.base import ChunkedMaintenanceCommand
+from gdpr.models import LegalReason
+
+
+def anonymize_purpose(pks, dry_run, model_label, purpose_slug):
+    u"""
+    Anonymize fields of the purpose of objects with given pks, fields retained by active legal reasons are skipped.
+
+    Anonymized fields, related objects and active legal reasons of the whole chunk are loaded at once and every object
+    is anonymized in its own transaction.
+    """
+    model = apps.get_model(model_label)
+    objs = list(model._base_manager.filter(pk__in=pks).order_by(u'pk'))
+    if dry_run:
+        return len(objs), []
+
+    purpose = purpose_register[purpose_slug]()
+    anonymizer = anonymizer_register[model]()
+    anonymizer.preload_anonymized_fields(objs)
+    anonymizer.prefetch_related_objects(objs, purpose.get_parsed_fields(model))
+    active_purpose_slugs = LegalReason.objects.get_active_consents_bulk(objs)
+
+    anonymized, failed = 0, []
+    for obj in objs:
+        try:
+            with transaction.atomic():
+                purpose.anonymize_obj(obj, anonymizer=anonymizer, other_purpose_slugs=active_purpose_slugs[obj.pk])
+        except Exception, ex:
+            failed.append((obj.pk, force_text(ex)))
+        else:
+            anonymized += 1
+    return anonymized, failed
+
+
+class Command(ChunkedMaintenanceCommand):
+    help = u'Anonymize fields of the purpose of all objects of the model which are not retained by active consents.'
+
+    chunk_function = staticmethod(anonymize_purpose)
+
+    def add_arguments(self, parser):
+        parser.add_argument(u'model', help=u'Model to anonymize in app_label.ModelName format')
+        parser.add_argument(u'purpose', help=u'Slug of the purpose whose fields are anonymized')
+        super(Command, self).add_arguments(parser)
+
+    def get_model(self, options):
+        try:
+            model = apps.get_model(options[u'model'])
+        except (LookupError, ValueError), ex:
+            raise CommandError(force_text(ex))
+        if model not in anonymizer_register:
+            raise CommandError(u'{} does not have registered anonymizer.'.format(model._meta.label))
+        if options[u'purpose'] not in purpose_register:
+            raise CommandError(u'Purpose {} does not exist.'.format(options[u'purpose']))
+        return model
+
+    def get_queryset(self, options):
+        return self.get_model(options)._base_manager.all()
+
+    def get_chunk_kwargs(self, options):
+        return {u'model_label': self.get_model(options)._meta.label, u'purpose_slug': options[u'purpose']}
@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from gdpr.models import AnonymizedData, LegalReason, LegalReasonRelatedObject
+from gdpr.utils import bulk_update, get_object_id_int
+
+# Model and its text object id field
+OBJECT_ID_FIELDS = (
+    (LegalReason, u'source_object_id'),
+    (LegalReasonRelatedObject, u'object_id'),
+    (AnonymizedData, u'object_id'),
+)
+
+
+class Command(BaseCommand):
+    help = u'Fill integer copies of generic object ids, run it before settings.GDPR_USE_INTEGER_OBJECT_ID is set.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(u'--chunk-size', type=int, default=1000, help=u'Number of rows updated at once')
+
+    def backfill(self, model, field_name, chunk_size):
+        int_field_name = u'{}_int'.format(field_name)
+        qs = model._base_manager.filter(**{u'{}__isnull'.format(int_field_name): True}).order_by(u'pk')
+        last_pk = None
+        updated = 0
+        while True:
+            chunk_qs = qs.filter(pk__gt=last_pk) if last_pk is not None else qs
+            rows = list(chunk_qs.values_list(u'pk', field_name)[:chunk_size])
+            if not rows:
+                return updated
+            last_pk = rows[-1][0]
+            objs = []
+            for pk, object_id in rows:
+                object_id_int = get_object_id_int(object_id)
+                # Ids which are not integers stay empty
+                if object_id_int is not None:
+                    objs.append(model(pk=pk, **{int_field_name: object_id_int}))
+            bulk_update(objs, (int_field_name,))
+            updated += len(objs)
+
+    def handle(self, *args, **options):
+        for model, field_name in OBJECT_ID_FIELDS:
+            updated = self.backfill(model, field_name, options[u'chunk_size'])
+            self.stdout.write(u'{}: {} rows updated'.format(model._meta.label, updated))
@@ -0,0 +1,20 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from gdpr.planning import AnonymizationPlanner
+
+
+class Command(BaseCommand):
+    help = u'Estimate rows touched and wall time of anonymization of consents which have past their expiration.'
+
+    def handle(self, *args, **options):
+        estimate = AnonymizationPlanner().estimate_expiration()
+        self.stdout.write(u'Legal reasons: {}'.format(estimate.legal_reasons))
+        for model, count in estimate.objects.items():
+            self.stdout.write(u'{}: {} objects'.format(model._meta.label, count))
+        self.stdout.write(u'Versions: {}'.format(estimate.versions))
+        self.stdout.write(u'AnonymizedData: {}'.format(estimate.anonymized_data))
+        if estimate.unestimated:
+            self.stdout.write(u'Not estimated relations: {}'.format(u', '.join(estimate.unestimated)))
+        self.stdout.write(u'Estimated time: {:.1f} s'.format(estimate.get_estimated_seconds()))
@@ -0,0 +1,23 @@
+from __future__ import absolute_import
+
+from gdpr.expiration import ExpirationEngine
+from gdpr.management.base import ChunkedMaintenanceCommand
+from gdpr.models import LegalReason
+
+
+def expire_consents(pks, dry_run):
+    u"""Anonymize source objects and expire active legal reasons with given pks which have past their expiration."""
+    queryset = LegalReason.objects.filter(pk__in=pks)
+    if dry_run:
+        return queryset.filter_active_and_expired().count(), []
+    report = ExpirationEngine(queryset, chunk_size=len(pks), fail_silently=True).run()
+    return report.expired, report.failed
+
+
+class Command(ChunkedMaintenanceCommand):
+    help = u'Anonymize source objects of consents which have past their expiration and expire the consents.'
+
+    chunk_function = staticmethod(expire_consents)
+
+    def get_queryset(self, options):
+        return LegalReason.objects.filter_active_and_expired()
@@ -0,0 +1,26 @@
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from gdpr.models import AnonymizationJob
+
+
+class Command(BaseCommand):
+    help = u'Anonymize source objects of pending jobs stored by gdpr.jobs.DatabaseQueueBackend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(u'--limit', type=int, default=None, help=u'Maximal number of processed jobs')
+        parser.add_argument(u'--sleep', type=float, default=None,
+                            help=u'Keep processing new jobs, sleep for given number of seconds when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = AnonymizationJob.objects.process_pending(options[u'limit'])
+            if processed or options[u'sleep'] is None:
+                self.stdout.write(u'{} jobs processed'.format(processed))
+            if options[u'sleep'] is None:
+                return
+            if not processed:
+                time.sleep(options[u'sleep'])
@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.utils.encoding import force_text
+
+from gdpr.content_types import get_model_for_content_type_id
+from gdpr.management.base import ChunkedMaintenanceCommand
+from gdpr.models import AnonymizedData
+
+
+def prune_anonymized_data(pks, dry_run):
+    u"""Delete anonymized field markers with given pks whose objects do not exist, one query per content type."""
+    object_ids = OrderedDict()
+    for pk, content_type_id, object_id in AnonymizedData.objects.filter(pk__in=pks).values_list(
+            u'pk', u'content_type_id', u'object_id'):
+        object_ids.setdefault(content_type_id, []).append((pk, object_id))
+
+    orphaned_pks = []
+    for content_type_id, rows in object_ids.items():
+        model = get_model_for_content_type_id(content_type_id)
+        if model is None:
+            # Model was removed, all its markers are orphaned
+            orphaned_pks += [pk for pk, _ in rows]
+            continue
+        object_pks = []
+        for _, object_id in rows:
+            try:
+                object_pks.append(model._meta.pk.to_python(object_id))
+            except ValidationError:
+                # Ids which are not valid primary keys cannot belong to any object
+                pass
+        existing_ids = set(force_text(pk) for pk in model._base_manager.filter(
+            pk__in=object_pks
+        ).values_list(u'pk', flat=True))
+        orphaned_pks += [pk for pk, object_id in rows if object_id not in existing_ids]
+
+    if orphaned_pks and not dry_run:
+        AnonymizedData.objects.filter(pk__in=orphaned_pks).delete()
+    return len(orphaned_pks), []
+
+
+class Command(ChunkedMaintenanceCommand):
+    help = u'Delete anonymized field markers of objects which do not exist anymore.'
+
+    chunk_function = staticmethod(prune_anonymized_data)
+
+    def get_queryset(self, options):
+        return AnonymizedData.objects.all()
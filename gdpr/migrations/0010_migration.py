@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# Partial index is supported by PostgreSQL and SQLite only
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite')
+PARTIAL_INDEX_NAME = 'gdpr_lr_active_expires_idx'
+
+
+def create_active_expires_at_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        # State 1 is LegalReasonState.ACTIVE
+        schema_editor.execute('CREATE INDEX {} ON {} ({}) WHERE {} = 1'.format(
+            schema_editor.quote_name(PARTIAL_INDEX_NAME),
+            schema_editor.quote_name(apps.get_model('gdpr', 'LegalReason')._meta.db_table),
+            schema_editor.quote_name('expires_at'),
+            schema_editor.quote_name('state'),
+        ))
+
+
+def drop_active_expires_at_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(PARTIAL_INDEX_NAME)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0009_migration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='legalreason',
+            index=models.Index(fields=['state', 'expires_at'], name='gdpr_lr_state_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='legalreason',
+            index=models.Index(fields=['source_object_content_type', 'source_object_id', 'state'],
+                               name='gdpr_lr_source_state_idx'),
+        ),
+        migrations.RunPython(create_active_expires_at_index, drop_active_expires_at_index),
+    ]
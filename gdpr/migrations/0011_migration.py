@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0010_migration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalreason',
+            name='source_object_id_int',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='legalreasonrelatedobject',
+            name='object_id_int',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anonymizeddata',
+            name='object_id_int',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0011_migration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnonymizationJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('state', models.SmallIntegerField(choices=[(1, 'PENDING'), (2, 'DONE'), (3, 'FAILED')], db_index=True,
+                                                   default=1)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('legal_reason', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                   related_name='anonymization_jobs', to='gdpr.LegalReason')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
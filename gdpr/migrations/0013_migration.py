@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('gdpr', '0012_migration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpirationCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('run_id', models.CharField(db_index=True, max_length=100)),
+                ('pk_from', models.BigIntegerField(blank=True, null=True)),
+                ('pk_to', models.BigIntegerField(blank=True, null=True)),
+                ('last_pk', models.BigIntegerField(blank=True, null=True)),
+                ('expired', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('errors', models.TextField(blank=True, default='[]')),
+                ('is_finished', models.BooleanField(default=False)),
+                ('source_object_content_type', models.ForeignKey(blank=True, null=True,
+                                                                 on_delete=django.db.models.deletion.DO_NOTHING,
+                                                                 to='contenttypes.ContentType')),
+            ],
+            options={
+                'ordering': ('run_id', 'pk'),
+            },
+        ),
+    ]
@@ -1,14 +1,71 @@
 # -*- coding: future_fstrings -*-
 from __future__ import absolute_import
 
+import hashlib
 import warnings
 
-from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models import Model
+from django.db.models import Exists, Model, OuterRef, QuerySet, TextField
+from django.db.models.functions import Cast
 from django.db.utils import Error
 
+from gdpr.content_types import get_content_type, get_content_type_id
 from gdpr.models import AnonymizedData, LegalReason, LegalReasonRelatedObject
+from gdpr.utils import get_object_id_filter, use_integer_object_id
+
+
+class AnonymizationModelQuerySetMixin(object):
+    u"""Queryset helpers filtering and annotating source objects by state of their consents in SQL."""
+
+    source_object_id_annotation = u'gdpr_source_object_id'
+
+    def _with_source_object_id(self):
+        u"""Annotate primary key as text which can be compared with text `LegalReason.source_object_id`."""
+        if self.source_object_id_annotation in self.query.annotations:
+            return self
+        return self.annotate(**{self.source_object_id_annotation: Cast(u'pk', TextField())})
+
+    def _get_valid_consent_exists(self, purpose_slug):
+        if use_integer_object_id(self.model):
+            source_object_id_filter = {u'source_object_id_int': OuterRef(u'pk')}
+        else:
+            source_object_id_filter = {u'source_object_id': OuterRef(self.source_object_id_annotation)}
+        return Exists(LegalReason.objects.filter_active_and_non_expired().filter(
+            purpose_slug=purpose_slug,
+            source_object_content_type_id=get_content_type_id(self.model),
+            **source_object_id_filter
+        ))
+
+    def annotate_has_valid_consent(self, purpose_slug, name = u'has_valid_consent'):
+        u"""
+        Annotate if objects have valid (ie. active and non-expired) consent with the purpose.
+
+        Args:
+            purpose_slug: Purpose slug to check consent for
+            name: Name of the boolean annotation
+        """
+        qs = self if use_integer_object_id(self.model) else self._with_source_object_id()
+        return qs.annotate(**{name: self._get_valid_consent_exists(purpose_slug)})
+
+    @staticmethod
+    def _get_valid_consent_annotation_name(purpose_slug):
+        # Slugs can contain characters which are not valid in annotation names (e.g. "-" or lookup separator "__"),
+        # filters of different purposes can be chained therefore the name is unique per purpose
+        return u'gdpr_has_valid_consent_{}'.format(hashlib.md5(purpose_slug.encode(u'utf-8')).hexdigest())
+
+    def filter_valid_consent(self, purpose_slug):
+        u"""Filter objects with valid (ie. active and non-expired) consent with the purpose."""
+        name = self._get_valid_consent_annotation_name(purpose_slug)
+        return self.annotate_has_valid_consent(purpose_slug, name).filter(**{name: True})
+
+    def exclude_valid_consent(self, purpose_slug):
+        u"""Filter objects without valid (ie. active and non-expired) consent with the purpose."""
+        name = self._get_valid_consent_annotation_name(purpose_slug)
+        return self.annotate_has_valid_consent(purpose_slug, name).filter(**{name: False})
+
+
+class AnonymizationModelQuerySet(AnonymizationModelQuerySetMixin, QuerySet):
+    pass
 
 
 class AnonymizationModelMixin(object):
@@ -16,7 +73,7 @@ class AnonymizationModelMixin(object):
     @property
     def content_type(self):
         u"""Get model ContentType"""
-        return ContentType.objects.get_for_model(self.__class__)
+        return get_content_type(self.__class__)
 
     def _anonymize_obj(self, *args, **kwargs):
         from gdpr.loading import anonymizer_register
@@ -44,14 +101,19 @@ class AnonymizationModelMixin(object):
     def delete(self, *args, **kwargs):
         u"""Cleanup anonymization metadata"""
         obj_id = unicode(self.pk)
+        content_type_id = get_content_type_id(self.__class__)
         super(AnonymizationModelMixin, self).delete(*args, **kwargs)
         try:
-            AnonymizedData.objects.filter(object_id=obj_id, content_type=self.content_type).delete()
+            AnonymizedData.objects.filter(
+                content_type_id=content_type_id, **get_object_id_filter(u'object_id', self.__class__, obj_id)
+            ).delete()
         except Error, e:
             # Better to just have some leftovers then to fail
             warnings.warn(u'An exception {} occurred during cleanup of {}'.format((unicode(e)), (unicode(self))))
         try:
-            LegalReasonRelatedObject.objects.filter(object_id=obj_id, object_content_type=self.content_type).delete()
+            LegalReasonRelatedObject.objects.filter(
+                object_content_type_id=content_type_id, **get_object_id_filter(u'object_id', self.__class__, obj_id)
+            ).delete()
         except Error, e:
             # Better to just have some leftovers then to fail
             warnings.warn(u'An exception {} occurred during cleanup of {}'.format((unicode(e)), (unicode(self))))
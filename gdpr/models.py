@@ -1,16 +1,29 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
+import json
+import operator
+from collections import OrderedDict, defaultdict
+from functools import reduce
+
 from chamber.models import SmartModel
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models, transaction
-from django.db.models import Q
+from django.db import connections, models, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Cast
 from django.utils import timezone
+from django.utils.encoding import force_text
 
-from .enums import LegalReasonState
+from .content_types import get_content_type_id, get_model_for_content_type_id
+from .enums import AnonymizationJobState, LegalReasonState
 from .loading import purpose_register
+from .utils import bulk_create, chunked, get_object_id_filter, get_object_id_int, use_integer_object_id
+
+DEFAULT_CONSENTS_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT_ERRORS = 10
 
 
 class LegalReasonManager(models.Manager):
@@ -37,7 +50,7 @@ class LegalReasonManager(models.Manager):
         issued_at = issued_at or timezone.now()
 
         legal_reason, created = LegalReason.objects.get_or_create(
-            source_object_content_type=ContentType.objects.get_for_model(source_object.__class__),
+            source_object_content_type_id=get_content_type_id(source_object.__class__),
             source_object_id=unicode(source_object.pk),
             purpose_slug=purpose_slug,
             defaults={
@@ -57,12 +70,142 @@ class LegalReasonManager(models.Manager):
 
         for related_object in related_objects or ():
             legal_reason.related_objects.update_or_create(
-                object_content_type=ContentType.objects.get_for_model(related_object.__class__),
+                object_content_type_id=get_content_type_id(related_object.__class__),
                 object_id=related_object.pk
             )
 
         return legal_reason
 
+    def create_consents_bulk(self, consents, issued_at = None, tag = None,
+                             batch_size = None):
+        u"""
+        Create (or renew, if they exist) Legal Reasons of many source objects at once.
+
+        Consents are processed in batches, every batch in a transaction. Existing Legal Reasons of a batch are resolved
+        with one query, missing ones are created with one bulk insert (conflicting rows are ignored where Django
+        supports it) and existing ones are renewed with a single UPDATE. Related objects are created with one bulk
+        insert. Unlike `create_consent` no `save` of existing Legal Reasons is called.
+
+        Args:
+            consents: Iterable of (source_object, purpose_slug) or (source_object, purpose_slug, related_objects)
+                tuples
+            issued_at: When the Legal Reason consents were given
+            tag: String that the developer can add to the created consents and use it to mark his business processes
+            batch_size: Number of consents processed at once, defaults to settings.GDPR_CONSENTS_BATCH_SIZE
+
+        Returns:
+            List of LegalReason objects in the order of consents
+        """
+        batch_size = batch_size or getattr(settings, u'GDPR_CONSENTS_BATCH_SIZE', DEFAULT_CONSENTS_BATCH_SIZE)
+        legal_reasons = []
+        for consents_batch in chunked(consents, batch_size):
+            legal_reasons += self._create_consents_batch(consents_batch, issued_at, tag)
+        return legal_reasons
+
+    def _get_legal_reasons_by_keys(self, keys):
+        u"""Get dictionary of Legal Reasons with (content type id, source object id, purpose slug) keys."""
+        object_ids = OrderedDict()
+        for content_type_id, object_id, purpose_slug in keys:
+            object_ids.setdefault(content_type_id, set()).add(object_id)
+        keys = set(keys)
+        legal_reasons = self.filter(
+            reduce(operator.or_, (
+                Q(source_object_content_type_id=content_type_id, **get_object_id_filter(
+                    u'source_object_id', get_model_for_content_type_id(content_type_id), list(ids)
+                ))
+                for content_type_id, ids in object_ids.items()
+            )),
+            purpose_slug__in=list(set(key[2] for key in keys))
+        )
+        return dict(
+            ((legal_reason.source_object_content_type_id, legal_reason.source_object_id, legal_reason.purpose_slug),
+             legal_reason)
+            for legal_reason in legal_reasons
+            if (legal_reason.source_object_content_type_id, legal_reason.source_object_id,
+                legal_reason.purpose_slug) in keys
+        )
+
+    def _create_consents_batch(self, consents, issued_at = None, tag = None):
+        now = timezone.now()
+        issued_at = issued_at or now
+
+        keys = []
+        related_objects_by_key = OrderedDict()
+        for consent in consents:
+            source_object, purpose_slug, related_objects = (tuple(consent) + (None,))[:3]
+            if purpose_slug not in purpose_register:
+                raise KeyError(u'Purpose with slug {} does not exits'.format(purpose_slug))
+            key = (get_content_type_id(source_object.__class__), unicode(source_object.pk), purpose_slug)
+            keys.append(key)
+            related_objects_by_key.setdefault(key, []).extend(related_objects or ())
+
+        with transaction.atomic():
+            legal_reasons = self._get_legal_reasons_by_keys(keys)
+            renewed_legal_reasons = list(legal_reasons.values())
+
+            missing_keys = [key for key in related_objects_by_key if key not in legal_reasons]
+            if missing_keys:
+                bulk_create([
+                    LegalReason(
+                        source_object_content_type_id=content_type_id,
+                        source_object_id=object_id,
+                        source_object_id_int=get_object_id_int(object_id),
+                        purpose_slug=purpose_slug,
+                        issued_at=issued_at,
+                        expires_at=issued_at + purpose_register[purpose_slug].expiration_timedelta,
+                        tag=tag,
+                        state=LegalReasonState.ACTIVE
+                    )
+                    for content_type_id, object_id, purpose_slug in missing_keys
+                ], ignore_conflicts=True)
+                # Primary keys are not returned by all databases
+                legal_reasons.update(self._get_legal_reasons_by_keys(missing_keys))
+
+            if renewed_legal_reasons:
+                self._renew_legal_reasons(renewed_legal_reasons, tag, now)
+
+            related_object_keys = set()
+            for key, related_objects in related_objects_by_key.items():
+                for related_object in related_objects:
+                    related_object_keys.add((
+                        legal_reasons[key].pk, get_content_type_id(related_object.__class__), unicode(related_object.pk)
+                    ))
+            if related_object_keys:
+                related_object_keys -= set(LegalReasonRelatedObject.objects.filter(
+                    legal_reason_id__in=list(set(key[0] for key in related_object_keys))
+                ).values_list(u'legal_reason_id', u'object_content_type_id', u'object_id'))
+                bulk_create([
+                    LegalReasonRelatedObject(
+                        legal_reason_id=legal_reason_id, object_content_type_id=content_type_id, object_id=object_id,
+                        object_id_int=get_object_id_int(object_id)
+                    )
+                    for legal_reason_id, content_type_id, object_id in sorted(related_object_keys)
+                ], ignore_conflicts=True)
+
+        return [legal_reasons[key] for key in keys]
+
+    def _renew_legal_reasons(self, legal_reasons, tag, now):
+        u"""Renew Legal Reasons with one UPDATE, the same way as `create_consent` renews existing Legal Reason."""
+        expires_at_by_purpose = dict(
+            (legal_reason.purpose_slug, now + purpose_register[legal_reason.purpose_slug].expiration_timedelta)
+            for legal_reason in legal_reasons
+        )
+        self.filter(pk__in=[legal_reason.pk for legal_reason in legal_reasons]).update(
+            expires_at=Case(
+                *[When(purpose_slug=purpose_slug, then=Value(expires_at, output_field=models.DateTimeField()))
+                  for purpose_slug, expires_at in expires_at_by_purpose.items()],
+                output_field=models.DateTimeField()
+            ),
+            tag=tag,
+            state=LegalReasonState.ACTIVE,
+            changed_at=now
+        )
+        for legal_reason in legal_reasons:
+            legal_reason.expires_at = expires_at_by_purpose[legal_reason.purpose_slug]
+            legal_reason.tag = tag
+            legal_reason.state = LegalReasonState.ACTIVE
+            legal_reason.changed_at = now
+
     def deactivate_consent(self, purpose_slug, source_object):
         u"""
         Deactivate/Remove consent (Legal reason) for source_object, purpose_slug combination
@@ -105,12 +248,117 @@ class LegalReasonManager(models.Manager):
             purpose_slug=purpose_slug
         ).exists()
 
-    def expire_old_consents(self):
+    def _get_consent_purposes_bulk(self, legal_reasons, source_objects, purpose_slugs = None,
+                                   batch_size = None):
+        if purpose_slugs is not None:
+            legal_reasons = legal_reasons.filter(purpose_slug__in=list(purpose_slugs))
+
+        consent_purposes = defaultdict(set)
+        if isinstance(source_objects, models.QuerySet):
+            model = source_objects.model
+            if use_integer_object_id(model):
+                batches = [{u'source_object_id_int__in': source_objects.order_by().values(u'pk')}]
+            else:
+                # Source object ids are text, primary keys are compared as text in a subquery
+                batches = [{u'source_object_id__in': source_objects.order_by().annotate(
+                    gdpr_source_object_id=Cast(u'pk', models.TextField())
+                ).values(u'gdpr_source_object_id')}]
+        else:
+            source_objects = list(source_objects)
+            if not source_objects:
+                return consent_purposes
+            model = source_objects[0].__class__
+            batch_size = batch_size or getattr(settings, u'GDPR_CONSENTS_BATCH_SIZE', DEFAULT_CONSENTS_BATCH_SIZE)
+            batches = [
+                get_object_id_filter(u'source_object_id', model, [obj.pk for obj in batch])
+                for batch in chunked(source_objects, batch_size)
+            ]
+
+        for source_object_id_filter in batches:
+            for source_object_id, purpose_slug in legal_reasons.filter(
+                    source_object_content_type_id=get_content_type_id(model),
+                    **source_object_id_filter
+            ).values_list(u'source_object_id', u'purpose_slug').distinct():
+                consent_purposes[model._meta.pk.to_python(source_object_id)].add(purpose_slug)
+        return consent_purposes
+
+    def get_valid_consents_bulk(self, source_objects, purpose_slugs = None,
+                                batch_size = None):
+        u"""
+        Get purposes of valid (ie. active and non-expired) consents of many source objects at once.
+
+        Args:
+            source_objects: List or queryset of source objects of one model
+            purpose_slugs: Purpose slugs to check consents for, all purposes if not set
+            batch_size: Number of objects of the list checked with one query, defaults to
+                settings.GDPR_CONSENTS_BATCH_SIZE, querysets are checked with one query
+
+        Returns:
+            defaultdict with source object pk keys and set of purpose slugs values, objects without valid consent are
+            missing
+        """
+        return self._get_consent_purposes_bulk(
+            self.get_queryset().filter_active_and_non_expired(), source_objects, purpose_slugs, batch_size
+        )
+
+    def get_deactivated_consents_bulk(self, source_objects, purpose_slugs = None,
+                                      batch_size = None):
+        u"""
+        Get purposes of deactivated consents of many source objects at once.
+
+        Args:
+            source_objects: List or queryset of source objects of one model
+            purpose_slugs: Purpose slugs to check consents for, all purposes if not set
+            batch_size: Number of objects of the list checked with one query, defaults to
+                settings.GDPR_CONSENTS_BATCH_SIZE, querysets are checked with one query
+
+        Returns:
+            defaultdict with source object pk keys and set of purpose slugs values, objects without deactivated
+            consent are missing
+        """
+        return self._get_consent_purposes_bulk(
+            self.get_queryset().filter(state=LegalReasonState.DEACTIVATED), source_objects, purpose_slugs, batch_size
+        )
+
+    def get_active_consents_bulk(self, source_objects, purpose_slugs = None,
+                                 batch_size = None):
+        u"""
+        Get purposes of active consents (including expired ones which were not anonymized yet) of many source objects.
+
+        Args:
+            source_objects: List or queryset of source objects of one model
+            purpose_slugs: Purpose slugs to check consents for, all purposes if not set
+            batch_size: Number of objects of the list checked with one query, defaults to
+                settings.GDPR_CONSENTS_BATCH_SIZE, querysets are checked with one query
+
+        Returns:
+            defaultdict with source object pk keys and set of purpose slugs values, objects without active consent
+            are missing
+        """
+        return self._get_consent_purposes_bulk(
+            self.get_queryset().filter_active(), source_objects, purpose_slugs, batch_size
+        )
+
+    def expire_old_consents(self, chunk_size=None, workers=None, run_id=None):
         u"""
         Anonymize and expire consents which have past their `expires_at`.
+
+        Args:
+            chunk_size: Number of consents processed at once, defaults to settings.GDPR_EXPIRATION_CHUNK_SIZE
+            workers: Number of worker processes, consents are expired in the current process if not set
+            run_id: Identifier of the run whose progress is stored to ExpirationCheckpoint after every chunk, run with
+                the same identifier restarted after a failure continues where it stopped
+
+        Returns:
+            ExpirationReport with the number of consents expired by this call
         """
-        for reason in LegalReason.objects.filter_active_and_expired():
-            reason.expire()
+        from gdpr.expiration import ExpirationEngine, ParallelExpirationRunner
+
+        if workers or run_id is not None:
+            return ParallelExpirationRunner(
+                self.get_queryset(), workers=workers or 1, chunk_size=chunk_size, run_id=run_id
+            ).run()
+        return ExpirationEngine(self.get_queryset(), chunk_size=chunk_size).run()
 
 
 class LegalReasonQuerySet(models.QuerySet):
@@ -151,8 +399,8 @@ class LegalReasonQuerySet(models.QuerySet):
 
     def filter_source_instance(self, source_object):
         return self.filter(
-            source_object_content_type=ContentType.objects.get_for_model(source_object.__class__),
-            source_object_id=unicode(source_object.pk)
+            source_object_content_type_id=get_content_type_id(source_object.__class__),
+            **get_object_id_filter(u'source_object_id', source_object.__class__, source_object.pk)
         )
 
     def filter_source_instance_active_non_expired(self, source_object):
@@ -205,6 +453,12 @@ class LegalReason(SmartModel):
         null=False, blank=False,
         db_index=True
     )
+    # Integer copy of source_object_id, None if the id is not an integer
+    source_object_id_int = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True
+    )
     source_object = GenericForeignKey(
         u'source_object_content_type', u'source_object_id'
     )
@@ -212,10 +466,21 @@ class LegalReason(SmartModel):
     class Meta:
         ordering = (u'-created_at',)
         unique_together = (u'purpose_slug', u'source_object_content_type', u'source_object_id')
+        indexes = [
+            # Expiration of active legal reasons
+            models.Index(fields=[u'state', u'expires_at'], name=u'gdpr_lr_state_expires_idx'),
+            # Active legal reasons of one source object
+            models.Index(fields=[u'source_object_content_type', u'source_object_id', u'state'],
+                         name=u'gdpr_lr_source_state_idx'),
+        ]
 
     def __str__(self):
         return unicode(self.purpose.name)
 
+    def save(self, *args, **kwargs):
+        self.source_object_id_int = get_object_id_int(self.source_object_id)
+        super(LegalReason, self).save(*args, **kwargs)
+
     @property
     def is_active(self):
         return self.state == LegalReasonState.ACTIVE
@@ -231,16 +496,26 @@ class LegalReason(SmartModel):
         purpose_register[self.purpose_slug]().deanonymize_obj(self.source_object, *args, **kwargs)
 
     def expire(self):
-        u"""Anonymize obj and set state as expired."""
-        with transaction.atomic():
-            self._anonymize_obj()
+        u"""Set state as expired and anonymize obj with settings.GDPR_ANONYMIZATION_BACKEND."""
+        from gdpr.instrumentation import get_instrumentation
+        from gdpr.jobs import get_anonymization_backend
+
+        instrumentation = get_instrumentation()
+        with instrumentation.span(u'expire', purpose=self.purpose_slug), transaction.atomic():
             self.change_and_save(state=LegalReasonState.EXPIRED)
+            get_anonymization_backend().enqueue(self)
+        instrumentation.increment(u'legal_reasons_expired', purpose=self.purpose_slug)
 
     def deactivate(self):
-        u"""Deactivate obj and run anonymization."""
-        with transaction.atomic():
-            self._anonymize_obj()
+        u"""Deactivate obj and run anonymization with settings.GDPR_ANONYMIZATION_BACKEND."""
+        from gdpr.instrumentation import get_instrumentation
+        from gdpr.jobs import get_anonymization_backend
+
+        instrumentation = get_instrumentation()
+        with instrumentation.span(u'deactivate', purpose=self.purpose_slug), transaction.atomic():
             self.change_and_save(state=LegalReasonState.DEACTIVATED)
+            get_anonymization_backend().enqueue(self)
+        instrumentation.increment(u'legal_reasons_deactivated', purpose=self.purpose_slug)
 
     def renew(self):
         with transaction.atomic():
@@ -270,6 +545,12 @@ class LegalReasonRelatedObject(SmartModel):
         blank=False,
         db_index=True
     )
+    # Integer copy of object_id, None if the id is not an integer
+    object_id_int = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True
+    )
     object = GenericForeignKey(
         u'object_content_type', u'object_id'
     )
@@ -281,14 +562,18 @@ class LegalReasonRelatedObject(SmartModel):
     def __str__(self):
         return u'{legal_reason} {object}'.format(legal_reason=self.legal_reason, object=self.object)
 
+    def save(self, *args, **kwargs):
+        self.object_id_int = get_object_id_int(self.object_id)
+        super(LegalReasonRelatedObject, self).save(*args, **kwargs)
+
 
 class AnonymizedDataQuerySet(models.QuerySet):
 
     def filter_source_instance_active(self, source_object):
         return self.filter(
-            content_type=ContentType.objects.get_for_model(source_object.__class__),
-            object_id=unicode(source_object.pk),
-            is_active=True
+            content_type_id=get_content_type_id(source_object.__class__),
+            is_active=True,
+            **get_object_id_filter(u'object_id', source_object.__class__, source_object.pk)
         )
 
 
@@ -310,6 +595,12 @@ class AnonymizedData(SmartModel):
         null=False,
         blank=False
     )
+    # Integer copy of object_id, None if the id is not an integer
+    object_id_int = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True
+    )
     object = GenericForeignKey(
         u'content_type', u'object_id'
     )
@@ -329,3 +620,157 @@ class AnonymizedData(SmartModel):
 
     def __str__(self):
         return u'{field} {object}'.format(field=self.field, object=self.object)
+
+    def save(self, *args, **kwargs):
+        self.object_id_int = get_object_id_int(self.object_id)
+        super(AnonymizedData, self).save(*args, **kwargs)
+
+
+class AnonymizationJobManager(models.Manager):
+
+    def process_pending(self, limit = None):
+        u"""
+        Anonymize source objects of pending jobs, every job in its own transaction.
+
+        Jobs are locked with SKIP LOCKED where the database supports it, so more workers can process the queue.
+
+        Args:
+            limit: Maximal number of processed jobs, all pending jobs are processed if not set
+
+        Returns:
+            Number of processed jobs
+        """
+        from gdpr.jobs import anonymize_legal_reason
+
+        processed = 0
+        while limit is None or processed < limit:
+            with transaction.atomic():
+                jobs = self.filter(state=AnonymizationJobState.PENDING).order_by(u'pk')
+                if connections[jobs.db].features.has_select_for_update_skip_locked:
+                    jobs = jobs.select_for_update(skip_locked=True)
+                else:
+                    jobs = jobs.select_for_update()
+                job = jobs.first()
+                if job is None:
+                    return processed
+                try:
+                    with transaction.atomic():
+                        anonymize_legal_reason(job.legal_reason)
+                except Exception, ex:
+                    job.change_and_save(state=AnonymizationJobState.FAILED, error=force_text(ex))
+                else:
+                    job.change_and_save(state=AnonymizationJobState.DONE)
+            processed += 1
+        return processed
+
+
+class AnonymizationJob(SmartModel):
+    STATES = ((e.value, e.name) for e in AnonymizationJobState)  # pylint: disable=not-an-iterable
+
+    objects = AnonymizationJobManager()
+
+    legal_reason = models.ForeignKey(
+        LegalReason,
+        null=False,
+        blank=False,
+        related_name=u'anonymization_jobs',
+        on_delete=models.CASCADE
+    )
+    state = models.SmallIntegerField(
+        null=False,
+        blank=False,
+        choices=STATES,
+        default=AnonymizationJobState.PENDING,
+        db_index=True
+    )
+    error = models.TextField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = (u'-created_at',)
+
+    def __str__(self):
+        return u'{legal_reason} {state}'.format(legal_reason=self.legal_reason, state=self.get_state_display())
+
+
+class ExpirationCheckpoint(SmartModel):
+    u"""
+    Progress of one shard of an expiration run, updated after every processed chunk so the run can be resumed.
+
+    Shard is a range of primary keys of legal reasons of one source object content type, shard of run which is not
+    split into shards has both empty.
+    """
+
+    run_id = models.CharField(
+        max_length=100,
+        null=False,
+        blank=False,
+        db_index=True
+    )
+    source_object_content_type = models.ForeignKey(
+        ContentType,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING
+    )
+    pk_from = models.BigIntegerField(
+        null=True,
+        blank=True
+    )
+    pk_to = models.BigIntegerField(
+        null=True,
+        blank=True
+    )
+    last_pk = models.BigIntegerField(
+        null=True,
+        blank=True
+    )
+    expired = models.PositiveIntegerField(
+        null=False,
+        blank=False,
+        default=0
+    )
+    failed = models.PositiveIntegerField(
+        null=False,
+        blank=False,
+        default=0
+    )
+    # JSON list of (legal reason pk, error message) samples of failed legal reasons
+    errors = models.TextField(
+        null=False,
+        blank=True,
+        default=u'[]'
+    )
+    is_finished = models.BooleanField(
+        default=False
+    )
+
+    class Meta:
+        ordering = (u'run_id', u'pk')
+
+    def __str__(self):
+        return u'{run_id} {pk_from}-{pk_to}'.format(run_id=self.run_id, pk_from=self.pk_from, pk_to=self.pk_to)
+
+    def get_errors(self):
+        return json.loads(self.errors)
+
+    def save_progress(self, last_pk, report):
+        u"""
+        Store primary key of the last processed legal reason and add counters and error samples of the chunk.
+
+        Args:
+            last_pk: Primary key of the last legal reason of the processed chunk
+            report: ExpirationReport of the chunk
+        """
+        max_errors = getattr(settings, u'GDPR_EXPIRATION_CHECKPOINT_ERRORS', DEFAULT_CHECKPOINT_ERRORS)
+        self.change_and_save(
+            last_pk=last_pk,
+            expired=self.expired + report.expired,
+            failed=self.failed + len(report.failed),
+            errors=json.dumps((self.get_errors() + [list(error) for error in report.failed])[:max_errors])
+        )
+
+    def finish(self):
+        self.change_and_save(is_finished=True)
@@ -0,0 +1,214 @@
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, TextField
+from django.db.models.fields.reverse_related import ForeignObjectRel
+from django.db.models.functions import Cast
+
+from gdpr.content_types import get_content_type_id, get_model_for_content_type_id
+from gdpr.loading import anonymizer_register, purpose_register
+from gdpr.utils import get_field_or_none, is_reversion_installed, use_integer_object_id
+
+# Seconds per updated object, rewritten version and written AnonymizedData row
+DEFAULT_COSTS = {
+    u'object': 0.005,
+    u'version': 0.001,
+    u'anonymized_data': 0.0005,
+}
+
+
+def get_costs():
+    u"""
+    Get per-row costs in seconds, defaults are updated with settings.GDPR_ANONYMIZATION_COSTS.
+
+    Costs should be calibrated by measuring a real run, cost of updated objects of a model can be set with
+    `app_label.ModelName` key.
+    """
+    costs = dict(DEFAULT_COSTS)
+    costs.update(getattr(settings, u'GDPR_ANONYMIZATION_COSTS', {}))
+    return costs
+
+
+class AnonymizationEstimate(object):
+    u"""
+    Estimated amount of work of an anonymization, numbers are upper bounds.
+
+    Fields retained by other purposes and fields which are already anonymized are not subtracted.
+
+    Args:
+        legal_reasons: Number of legal reasons
+        objects: OrderedDict with model keys and number of updated objects values
+        versions: Number of rewritten reversion versions
+        anonymized_data: Number of written AnonymizedData rows
+        unestimated: Labels of relations which cannot be estimated with a query (e.g. relations of RelationAnonymizer)
+    """
+
+    def __init__(self):
+        self.legal_reasons = 0
+        self.objects = OrderedDict()
+        self.versions = 0
+        self.anonymized_data = 0
+        self.unestimated = []
+
+    def __repr__(self):
+        return u'<AnonymizationEstimate objects={} versions={} anonymized_data={} seconds={:.1f}>'.format(
+            sum(self.objects.values()), self.versions, self.anonymized_data, self.get_estimated_seconds()
+        )
+
+    def add_objects(self, model, count):
+        self.objects[model] = self.objects.get(model, 0) + count
+
+    def merge(self, other):
+        self.legal_reasons += other.legal_reasons
+        for model, count in other.objects.items():
+            self.add_objects(model, count)
+        self.versions += other.versions
+        self.anonymized_data += other.anonymized_data
+        self.unestimated += [label for label in other.unestimated if label not in self.unestimated]
+        return self
+
+    def get_estimated_seconds(self, costs=None):
+        u"""
+        Args:
+            costs: Per-row costs in seconds, defaults to `get_costs()`
+        """
+        costs = costs or get_costs()
+        return (
+            sum(count * costs.get(model._meta.label, costs[u'object']) for model, count in self.objects.items())
+            + self.versions * costs[u'version']
+            + self.anonymized_data * costs[u'anonymized_data']
+        )
+
+
+class AnonymizationPlanner(object):
+    u"""
+    Estimate work of anonymization by walking the parsed Fields tree with COUNT queries only.
+
+    Objects of every level of the tree are selected with a subquery of the previous level, no objects are loaded.
+    """
+
+    def get_related_queryset(self, model, queryset, name, related_model):
+        u"""Get queryset of objects related to objects of `queryset` via relation `name` or None if not supported."""
+        field = get_field_or_none(model, name)
+        if field is None or not field.is_relation or related_model is None:
+            return None
+        if field.concrete and (field.many_to_one or field.one_to_one):
+            lookups = {u'{}__in'.format(field.target_field.attname): queryset.values(field.attname)}
+        elif field.concrete and field.many_to_many:
+            lookups = {u'pk__in': queryset.values(name)}
+        elif isinstance(field, ForeignObjectRel):
+            # Reverse relation of foreign key, one to one or many to many field of the related model
+            target = u'pk' if field.many_to_many else field.field.target_field.attname
+            lookups = {u'{}__in'.format(field.field.name): queryset.values(target)}
+        else:
+            return None
+        return related_model._base_manager.filter(**lookups).distinct()
+
+    def count_versions(self, model, queryset):
+        u"""Count reversion versions of objects of `queryset` and their parent objects."""
+        from reversion.models import Version
+
+        references = [(model, u'pk')]
+        for parent_model in model._meta.get_parent_list():
+            parent_link = model._meta.get_ancestor_link(parent_model)
+            references.append((parent_model, parent_link.attname if parent_link else u'pk'))
+
+        count = 0
+        for reference_model, attname in references:
+            count += Version.objects.filter(
+                content_type_id=get_content_type_id(reference_model),
+                object_id__in=queryset.annotate(gdpr_version_object_id=Cast(attname, TextField())).values(
+                    u'gdpr_version_object_id'
+                )
+            ).count()
+        return count
+
+    def estimate_objects(self, queryset, parsed_fields, estimate=None):
+        u"""
+        Estimate anonymization of fields `parsed_fields` of objects of `queryset`.
+
+        Args:
+            queryset: Objects to anonymize
+            parsed_fields: Fields of the model of `queryset`
+            estimate: AnonymizationEstimate the numbers are added to, a new one is created if not set
+        """
+        estimate = estimate or AnonymizationEstimate()
+        model = queryset.model
+        if parsed_fields.local_fields:
+            count = queryset.count()
+            if not count:
+                return estimate
+            estimate.add_objects(model, count)
+            estimate.anonymized_data += count * len(parsed_fields.local_fields)
+            # Reversion anonymization is configured per anonymizer, no object is loaded to ask `anonymize_reversion`
+            if is_reversion_installed() and getattr(parsed_fields.anonymizer.Meta, u'anonymize_reversion', False):
+                estimate.versions += self.count_versions(model, queryset)
+
+        for name, related_fields in parsed_fields.related_fields.items():
+            related_queryset = self.get_related_queryset(model, queryset, name, related_fields.model)
+            if related_queryset is None:
+                label = u'{}.{}'.format(model._meta.label, name)
+                if label not in estimate.unestimated:
+                    estimate.unestimated.append(label)
+            else:
+                self.estimate_objects(related_queryset, related_fields, estimate)
+        return estimate
+
+    def estimate_purpose(self, purpose_slug, queryset, estimate=None):
+        u"""
+        Estimate anonymization of fields of the purpose of objects of `queryset`.
+
+        Args:
+            purpose_slug: Slug of the purpose
+            queryset: Objects to anonymize
+            estimate: AnonymizationEstimate the numbers are added to, a new one is created if not set
+        """
+        estimate = estimate or AnonymizationEstimate()
+        purpose = purpose_register[purpose_slug]()
+        if not purpose.fields or queryset.model not in anonymizer_register:
+            return estimate
+        return self.estimate_objects(queryset, purpose.get_parsed_fields(queryset.model), estimate)
+
+    def get_source_objects(self, model, legal_reasons):
+        u"""Get queryset of source objects of `model` of legal reasons, compared in a subquery."""
+        if use_integer_object_id(model):
+            return model._base_manager.filter(pk__in=legal_reasons.values(u'source_object_id_int'))
+        return model._base_manager.annotate(gdpr_source_object_id=Cast(u'pk', TextField())).filter(
+            gdpr_source_object_id__in=legal_reasons.values(u'source_object_id')
+        )
+
+    def estimate_legal_reasons(self, legal_reasons):
+        u"""
+        Estimate anonymization of source objects of legal reasons, e.g. when they are expired or deactivated.
+
+        Args:
+            legal_reasons: LegalReason queryset
+        """
+        estimate = AnonymizationEstimate()
+        groups = legal_reasons.order_by().values(u'source_object_content_type', u'purpose_slug').annotate(
+            count=Count(u'pk')
+        ).order_by(u'source_object_content_type', u'purpose_slug')
+        for row in groups:
+            estimate.legal_reasons += row[u'count']
+            model = get_model_for_content_type_id(row[u'source_object_content_type'])
+            if model is None:
+                continue
+            source_objects = self.get_source_objects(model, legal_reasons.filter(
+                source_object_content_type_id=row[u'source_object_content_type'], purpose_slug=row[u'purpose_slug']
+            ))
+            self.estimate_purpose(row[u'purpose_slug'], source_objects, estimate)
+        return estimate
+
+    def estimate_expiration(self, queryset=None):
+        u"""
+        Estimate anonymization of source objects of active legal reasons which have past their expiration.
+
+        Args:
+            queryset: LegalReason queryset, defaults to all legal reasons
+        """
+        from gdpr.models import LegalReason
+
+        queryset = queryset if queryset is not None else LegalReason.objects.all()
+        return self.estimate_legal_reasons(queryset.filter_active_and_expired())
@@ -5,7 +5,7 @@ from django.db.models import Q
 from typing import Any, Dict, KeysView, List, Tuple, Union
 
 from gdpr.enums import LegalReasonState
-from gdpr.fields import Fields
+from gdpr.fields import Fields, get_cached, get_cached_fields
 from gdpr.loading import anonymizer_register, purpose_register
 
 FieldList = Union[List[unicode], Tuple, KeysView[unicode]]  # List, tuple or return of dict keys() method.
@@ -45,44 +45,83 @@ class AbstractPurpose(object):
     anonymize_legal_reason_related_objects_only = None
 
     def get_parsed_fields(self, model):
-        return Fields(self.fields or (), model)
+        u"""Get Fields of the purpose for the model with new anonymizer instances, parsed once per purpose and model."""
+        if not self.slug:
+            return Fields(self.fields or (), model)
+        return get_cached_fields((self.slug, model), self.fields or (), model)
+
+    def get_parsed_fields_without(self, model, purpose_slugs):
+        u"""
+        Get Fields of the purpose for the model without fields of other purposes, cached per combination of purposes.
+
+        Args:
+            model: Model of the fields
+            purpose_slugs: Slugs of purposes whose fields are retained
+        """
+        purpose_slugs = frozenset(purpose_slugs)
+
+        def get_fields():
+            parsed_fields = self.get_parsed_fields(model)
+            for slug in sorted(purpose_slugs):
+                parsed_fields -= purpose_register[slug]().get_parsed_fields(model)
+            return parsed_fields
+
+        if not self.slug:
+            return get_fields()
+        return get_cached((self.slug, model, purpose_slugs), get_fields)
+
+    def get_other_purpose_slugs(self, obj, legal_reason = None,
+                                excluded_legal_reasons = None):
+        u"""Get slugs of purposes of other active legal reasons of the object with one query."""
+        from gdpr.models import LegalReason  # noqa
+
+        other_legal_reasons = LegalReason.objects.filter_source_instance(obj).filter(state=LegalReasonState.ACTIVE)
+        if legal_reason:
+            other_legal_reasons = other_legal_reasons.filter(~Q(pk=legal_reason.pk))
+        if excluded_legal_reasons:
+            other_legal_reasons = other_legal_reasons.exclude(pk__in=[i.pk for i in excluded_legal_reasons])
+        return set(other_legal_reasons.order_by().values_list(u'purpose_slug', flat=True).distinct())
 
     def deanonymize_obj(self, obj, fields = None):
-        fields = fields or self.fields or ()
-        if len(fields) == 0:
+        if len(fields or self.fields or ()) == 0:
             # If there are no fields to deanonymize do nothing.
             return
         obj_model = obj.__class__
         anonymizer  = anonymizer_register[obj_model]()
-        anonymizer.deanonymize_obj(obj, fields)
+        anonymizer.deanonymize_obj(obj, Fields(fields, obj_model) if fields else self.get_parsed_fields(obj_model))
 
     def anonymize_obj(self, obj, legal_reason = None,
-                      fields = None):
-        fields = fields or self.fields or ()
-        if len(fields) == 0:
+                      fields = None, excluded_legal_reasons = None, anonymizer = None,
+                      other_purpose_slugs = None):
+        u"""
+        Anonymize fields of the purpose which are not retained by other active legal reasons of the object.
+
+        Args:
+            obj: Object to anonymize
+            legal_reason: Legal reason which is being expired or deactivated
+            fields: Fields matrix overriding fields of the purpose
+            excluded_legal_reasons: Other legal reasons which are being expired together with `legal_reason`
+            anonymizer: Anonymizer instance of the object model, e.g. with preloaded anonymized fields
+            other_purpose_slugs: Slugs of purposes of other active legal reasons of the object if they are already
+                known, they are loaded from the database otherwise
+        """
+        if len(fields or self.fields or ()) == 0:
             # If there are no fields to anonymize do nothing.
             return
-        from gdpr.models import LegalReason  # noqa
 
         obj_model = obj.__class__
-        anonymizer  = anonymizer_register[obj_model]()
+        anonymizer = anonymizer or anonymizer_register[obj_model]()
 
         # MultiLegalReason
-        other_legal_reasons = LegalReason.objects.filter_source_instance(obj).filter(state=LegalReasonState.ACTIVE)
-        if legal_reason:
-            other_legal_reasons = other_legal_reasons.filter(~Q(pk=legal_reason.pk))
-        if other_legal_reasons.count() == 0:
-            anonymizer.anonymize_obj(obj, legal_reason, self, fields)
-            return
-
-        from gdpr.loading import purpose_register
-
-        parsed_fields = self.get_parsed_fields(obj_model)
-
-        # Transform legal_reasons to fields
-        for allowed_fields in [purpose_register[slug]().get_parsed_fields(obj_model) for slug in
-                               set([i.purpose_slug for i in other_legal_reasons])]:
-            parsed_fields -= allowed_fields
+        if other_purpose_slugs is None:
+            other_purpose_slugs = self.get_other_purpose_slugs(obj, legal_reason, excluded_legal_reasons)
+
+        if fields:
+            parsed_fields = Fields(fields, obj_model)
+            for slug in other_purpose_slugs:
+                parsed_fields -= purpose_register[slug]().get_parsed_fields(obj_model)
+        else:
+            parsed_fields = self.get_parsed_fields_without(obj_model, other_purpose_slugs)
 
         if len(parsed_fields) == 0:
             # If there are no fields to anonymize do nothing.
@@ -1,6 +1,11 @@
 from __future__ import absolute_import
 
+from contextlib import contextmanager
+
+import django
 from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorWrapper
 
 
 def str_to_class(class_string):
@@ -25,6 +30,224 @@ def get_number_guess_len(value):
     return guess_len if guess_len % 2 != 0 else (guess_len - 1)
 
 
+def chunked(iterable, size):
+    u"""
+    Split iterable to lists of at most `size` items.
+
+    Args:
+        iterable: Iterable to split
+        size: Maximal length of one chunk
+
+    Returns:
+        Generator of lists
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_update(objs, fields, batch_size=None):
+    u"""
+    Save values of `fields` of model instances with one UPDATE query per batch.
+
+    Uses `QuerySet.bulk_update` if Django provides it, otherwise builds the same CASE WHEN update.
+
+    Args:
+        objs: Model instances of the same model
+        fields: Names of fields to save
+        batch_size: Maximal number of instances updated with one query
+    """
+    from django.db.models import Case, Value, When
+
+    objs = list(objs)
+    if not objs or not fields:
+        return
+    model = objs[0].__class__
+    manager = model._base_manager
+    if hasattr(manager, u'bulk_update'):
+        manager.bulk_update(objs, fields, batch_size=batch_size)
+        return
+
+    model_fields = [model._meta.get_field(name) for name in fields]
+    # Every instance needs two query parameters per field and one for the pk filter
+    batch_size = batch_size or max(1, 900 // (2 * len(model_fields) + 1))
+    for batch in chunked(objs, batch_size):
+        update_kwargs = {}
+        for field in model_fields:
+            update_kwargs[field.attname] = Case(
+                *[When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in batch],
+                output_field=field
+            )
+        manager.filter(pk__in=[obj.pk for obj in batch]).update(**update_kwargs)
+
+
+def bulk_create(objs, batch_size=None, ignore_conflicts=False):
+    u"""
+    Insert model instances with one INSERT query per batch.
+
+    Args:
+        objs: Model instances of the same model
+        batch_size: Maximal number of instances inserted with one query
+        ignore_conflicts: Skip rows which violate unique constraints, supported only by Django 2.2+, conflicting rows
+            raise IntegrityError with older versions
+
+    Returns:
+        List of created instances, primary keys are not set with some databases or if conflicts are ignored
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    kwargs = {u'batch_size': batch_size}
+    if ignore_conflicts and django.VERSION >= (2, 2):
+        kwargs[u'ignore_conflicts'] = True
+    return objs[0].__class__._base_manager.bulk_create(objs, **kwargs)
+
+
+class QueryCounter(object):
+    u"""Number of database queries executed while the counter is active."""
+
+    def __init__(self):
+        self.count = 0
+
+
+class _QueryCountingCursorWrapper(CursorWrapper):
+    u"""Cursor wrapper incrementing active query counters of its connection."""
+
+    def __init__(self, cursor, db, counters):
+        super(_QueryCountingCursorWrapper, self).__init__(cursor, db)
+        self.counters = counters
+
+    def _count(self):
+        for counter in self.counters:
+            counter.count += 1
+
+    def callproc(self, procname, params=None):
+        self._count()
+        return self.cursor.callproc(procname, params)
+
+    def execute(self, sql, params=None):
+        self._count()
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self._count()
+        return self.cursor.executemany(sql, param_list)
+
+
+def _wrap_cursor_factory(make_cursor, connection, counters):
+    def make_counting_cursor(cursor):
+        wrapped_cursor = make_cursor(cursor)
+        if not counters:
+            return wrapped_cursor
+        return _QueryCountingCursorWrapper(wrapped_cursor, connection, counters)
+    return make_counting_cursor
+
+
+def _get_query_counters(connection):
+    u"""
+    Get list of active query counters of the connection, cursor factories of the connection are wrapped on first use.
+
+    Connections are not shared between threads, so are the counters.
+    """
+    counters = connection.__dict__.get(u'_gdpr_query_counters')
+    if counters is None:
+        counters = connection._gdpr_query_counters = []
+        for name in (u'make_cursor', u'make_debug_cursor'):
+            setattr(connection, name, _wrap_cursor_factory(getattr(connection, name), connection, counters))
+    return counters
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    u"""
+    Count database queries executed in the block.
+
+    Cursors of the connection are wrapped and every executed query increments an integer counter, query log and debug
+    cursor are not used.
+
+    Args:
+        using: Alias of the database
+
+    Yields:
+        QueryCounter with the number of queries executed so far
+    """
+    counters = _get_query_counters(connections[using])
+    counter = QueryCounter()
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+INTEGER_FIELD_TYPES = (
+    u'AutoField', u'BigAutoField', u'BigIntegerField', u'IntegerField', u'PositiveIntegerField',
+    u'PositiveSmallIntegerField', u'SmallIntegerField'
+)
+# Range of BigIntegerField
+MAX_OBJECT_ID_INT = 9223372036854775807
+
+
+def get_object_id_int(object_id):
+    u"""
+    Get value of integer shadow column of generic object id.
+
+    Returns:
+        Integer object id or None if the object id is not a canonical integer in the range of BigIntegerField
+    """
+    try:
+        value = int(object_id)
+    except (TypeError, ValueError):
+        return None
+    if unicode(value) != unicode(object_id) or abs(value) > MAX_OBJECT_ID_INT:
+        return None
+    return value
+
+
+def has_integer_pk(model):
+    pk = model._meta.pk
+    while pk.is_relation:
+        pk = pk.target_field
+    return pk.get_internal_type() in INTEGER_FIELD_TYPES
+
+
+def use_integer_object_id(model):
+    u"""Check if integer shadow columns of generic object ids are used in lookups of objects of the model."""
+    from django.conf import settings
+
+    return bool(getattr(settings, u'GDPR_USE_INTEGER_OBJECT_ID', False) and model is not None and has_integer_pk(model))
+
+
+def get_object_id_filter(field_name, model, object_id):
+    u"""
+    Get filter kwargs of generic object id field matching objects of the model.
+
+    Integer shadow column `<field_name>_int` is used if settings.GDPR_USE_INTEGER_OBJECT_ID is set and the model has
+    integer primary key, text column otherwise.
+
+    Args:
+        field_name: Name of the text object id field
+        model: Model of the objects
+        object_id: Primary key or list of primary keys of the objects, list is filtered with `__in`
+
+    Returns:
+        Dictionary with filter kwargs
+    """
+    is_list = isinstance(object_id, (list, tuple, set, frozenset))
+    if use_integer_object_id(model):
+        field_name, to_value = u'{}_int'.format(field_name), int
+    else:
+        to_value = unicode
+    if is_list:
+        return {u'{}__in'.format(field_name): [to_value(i) for i in object_id]}
+    return {field_name: to_value(object_id)}
+
+
 def get_field_or_none(model, field_name):
     u"""
     Use django's _meta field api to get field or return None.
@@ -50,22 +273,38 @@ Enable support for druids reversion fork
 
 def get_reversion_versions(obj):
     from reversion.models import Version
-    from django.contrib.contenttypes.models import ContentType
+    from gdpr.content_types import get_content_type_id
 
     if hasattr(Version.objects, u'get_for_object'):
         return Version.objects.get_for_object(obj).order_by(u'id')
-    content_type = ContentType.objects.get_for_model(obj.__class__)
+    content_type_id = get_content_type_id(obj.__class__)
     if isinstance(obj.pk, int):
-        return Version.objects.filter(content_type=content_type, object_id_int=obj.pk).order_by(u'id')
+        return Version.objects.filter(content_type_id=content_type_id, object_id_int=obj.pk).order_by(u'id')
+    else:
+        return Version.objects.filter(content_type_id=content_type_id, object_id=obj.pk).order_by(u'id')
+
+
+def get_reversion_versions_by_reference(model, object_id):
+    u"""Get versions of the object of the model with primary key `object_id` without loading the object."""
+    from reversion.models import Version
+    from gdpr.content_types import get_content_type_id
+
+    if hasattr(Version.objects, u'get_for_object_reference'):
+        return Version.objects.get_for_object_reference(model, object_id).order_by(u'id')
+    content_type_id = get_content_type_id(model)
+    if isinstance(object_id, int):
+        return Version.objects.filter(content_type_id=content_type_id, object_id_int=object_id).order_by(u'id')
     else:
-        return Version.objects.filter(content_type=content_type, object_id=obj.pk).order_by(u'id')
+        return Version.objects.filter(content_type_id=content_type_id, object_id=object_id).order_by(u'id')
 
 
 def get_reversion_version_model(version):
     u"""Get object model of the version."""
+    from gdpr.content_types import get_model_for_content_type_id
+
     if hasattr(version, u'_model'):
         return version._model
-    return version.content_type.model_class()
+    return get_model_for_content_type_id(version.content_type_id)
 
 
 def get_reversion_local_field_dict(obj):
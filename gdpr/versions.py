@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+
+import json
+import sys
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+from django.utils.encoding import is_protected_type
+
+from gdpr.utils import get_field_or_none
+
+# Faster JSON libraries are used for parsing when they are installed and dictionaries keep the order of keys.
+# Payloads are always encoded with the json module so they are byte-identical to the output of the Django serializer
+# (separators and ASCII escaping) which reversion writes.
+json_loads = None
+if sys.version_info >= (3, 7):
+    try:
+        import orjson
+
+        json_loads = orjson.loads
+    except ImportError:
+        try:
+            import ujson
+
+            json_loads = ujson.loads
+        except ImportError:
+            pass
+
+if json_loads is None:
+    def json_loads(value):
+        return json.loads(value, object_pairs_hook=OrderedDict)
+
+
+def json_dumps(value):
+    u"""Encode value the same way as the Django JSON serializer does."""
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+_django_json_encoder = DjangoJSONEncoder()
+
+
+def to_json_value(value):
+    u"""Convert protected type value (number, date, time, decimal) to the value DjangoJSONEncoder would output."""
+    if value is None or isinstance(value, six.integer_types + (bool, float)):
+        return value
+    return _django_json_encoder.default(value)
+
+
+class _FieldValue(object):
+    u"""Minimal object holding one field value, enough for `Field.value_to_string`."""
+
+    def __init__(self, field, value):
+        setattr(self, field.attname, value)
+
+
+class SerializedVersionData(object):
+    u"""
+    Serialized data of a reversion version which are read and patched without creating model instances.
+
+    The payload is parsed once, only anonymized keys under `fields` are replaced and the payload is encoded back.
+    Use `from_version` to get the data, only versions serialized to JSON are supported.
+    """
+
+    def __init__(self, version, data, model, field_names):
+        self.version = version
+        self.data = data
+        self.model = model
+        self.fields = data[0][u'fields']
+        self.field_dict = dict(
+            (name, model._meta.get_field(name).to_python(self.fields[name]))
+            for name in field_names if name in self.fields
+        )
+
+    @classmethod
+    def from_version(cls, version, field_names):
+        u"""
+        Args:
+            version: Reversion version
+            field_names: Names of the fields which will be read or patched
+
+        Returns:
+            Serialized data of the version or None if the version is not serialized to JSON or some of the fields is
+            not a concrete value field
+        """
+        if version.format != u'json':
+            return None
+        data = json_loads(version.serialized_data)
+        if len(data) != 1:
+            return None
+        model = apps.get_model(data[0][u'model'])
+        for name in field_names:
+            if name in data[0][u'fields']:
+                field = get_field_or_none(model, name)
+                if field is None or field.is_relation or not field.concrete:
+                    return None
+        return cls(version, data, model, field_names)
+
+    def __contains__(self, name):
+        return name in self.field_dict
+
+    def update(self, update_data):
+        u"""Set new values of the fields, values are serialized the same way as the Django serializer does."""
+        for name, value in update_data.items():
+            field = self.model._meta.get_field(name)
+            self.fields[name] = (
+                to_json_value(value) if is_protected_type(value) else field.value_to_string(_FieldValue(field, value))
+            )
+            self.field_dict[name] = value
+        self.version.serialized_data = json_dumps(self.data)
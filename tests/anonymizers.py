@@ -1,7 +1,7 @@
 # -*- coding: future_fstrings -*-
 from __future__ import absolute_import
 from gdpr import anonymizers
-from tests.models import Customer
+from tests.models import Account, Customer, Email
 
 
 class CustomerAnonymizer(anonymizers.ModelAnonymizer):
@@ -14,3 +14,17 @@ class CustomerAnonymizer(anonymizers.ModelAnonymizer):
 
     class Meta(object):
         model = Customer
+
+
+class EmailAnonymizer(anonymizers.ModelAnonymizer):
+    email = anonymizers.MD5TextFieldAnonymizer()
+
+    class Meta(object):
+        model = Email
+
+
+class AccountAnonymizer(anonymizers.ModelAnonymizer):
+    owner = anonymizers.MD5TextFieldAnonymizer()
+
+    class Meta(object):
+        model = Account
@@ -14,7 +14,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from gdpr.mixins import AnonymizationModel
+from gdpr.mixins import AnonymizationModel, AnonymizationModelQuerySet
 from gdpr.utils import is_reversion_installed
 
 
@@ -24,6 +24,8 @@ class Customer(AnonymizationModel):
     last_name = models.CharField(max_length=256)
     primary_email_address = models.EmailField(blank=True, null=True)
 
+    objects = AnonymizationModelQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         u"""Just helper method for saving full name.
 
@@ -36,6 +38,17 @@ class Customer(AnonymizationModel):
         return u"{} {}".format((self.first_name), (self.last_name))
 
 
+class Email(AnonymizationModel):
+    customer = models.ForeignKey(Customer, related_name=u"emails", on_delete=models.CASCADE)
+    email = models.EmailField(blank=True, null=True)
+
+
+class Account(AnonymizationModel):
+    customer = models.ForeignKey(Customer, related_name=u"accounts", on_delete=models.CASCADE)
+    number = models.CharField(max_length=256, blank=True, null=True)
+    owner = models.CharField(max_length=256, blank=True, null=True)
+
+
 class TopParentA(AnonymizationModel):
     name = models.CharField(max_length=250)
 
@@ -12,3 +12,14 @@ class FirstNLastNamePurpose(AbstractPurpose):
     slug = FIRST_AND_LAST_NAME_SLUG
     expiration_timedelta = relativedelta(years=10)
     fields = ("first_name", "last_name")
+
+
+FIRST_NAME_SLUG = "FN"
+
+
+class FirstNamePurpose(AbstractPurpose):
+    """Store First name for 5 years."""
+    name = "retain first name"
+    slug = FIRST_NAME_SLUG
+    expiration_timedelta = relativedelta(years=5)
+    fields = ("first_name",)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+from dateutil.relativedelta import relativedelta
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from freezegun import freeze_time
+
+from gdpr.enums import LegalReasonState
+from gdpr.models import AnonymizedData, LegalReason
+from tests.models import Customer
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG, FIRST_NAME_SLUG
+from tests.tests.data import CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS, CUSTOMER__LAST_NAME
+from tests.tests.utils import AnonymizedDataMixin
+
+
+class TestMaintenanceCommands(AnonymizedDataMixin, TestCase):
+
+    def setUp(self):
+        self.customers = [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(3)]
+        self.tmp_dir = tempfile.mkdtemp()
+        self.heartbeat_file = os.path.join(self.tmp_dir, u'heartbeat.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def call_command(self, *args, **kwargs):
+        call_command(*args, stdout=StringIO(), stderr=StringIO(), heartbeat_file=self.heartbeat_file, **kwargs)
+        with open(self.heartbeat_file) as heartbeat_file:
+            return json.load(heartbeat_file)
+
+    def get_future(self):
+        return datetime.datetime.now() + relativedelta(years=10, days=1)
+
+    def test_expire_consents_dry_run(self):
+        for customer in self.customers:
+            customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+
+        with freeze_time(self.get_future()):
+            progress = self.call_command(u'gdpr_expire_consents', dry_run=True)
+
+        self.assertEqual(progress[u'processed'], 3)
+        self.assertTrue(progress[u'finished'])
+        self.assertFalse(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).exists())
+
+    def test_expire_consents_with_limit_and_resume(self):
+        legal_reasons = [customer.create_consent(FIRST_AND_LAST_NAME_SLUG) for customer in self.customers]
+
+        with freeze_time(self.get_future()):
+            progress = self.call_command(u'gdpr_expire_consents', chunk_size=1, limit=2)
+            self.assertEqual(progress[u'processed'], 2)
+            self.assertEqual(progress[u'last_pk'], unicode(legal_reasons[1].pk))
+
+            progress = self.call_command(u'gdpr_expire_consents', resume_from=progress[u'last_pk'])
+            self.assertEqual(progress[u'processed'], 1)
+
+        self.assertEqual(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).count(), 3)
+        for customer in self.customers:
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u'first_name')
+
+    def test_anonymize_purpose_retains_fields_of_active_consents(self):
+        self.customers[0].create_consent(FIRST_NAME_SLUG)
+
+        progress = self.call_command(u'gdpr_anonymize_purpose', u'tests.Customer', FIRST_AND_LAST_NAME_SLUG)
+
+        self.assertEqual(progress[u'processed'], 3)
+        retained_customer = Customer.objects.get(pk=self.customers[0].pk)
+        self.assertEqual(retained_customer.first_name, CUSTOMER__FIRST_NAME)
+        self.assertNotEqual(retained_customer.last_name, CUSTOMER__LAST_NAME)
+        for customer in self.customers[1:]:
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+            self.assertNotEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
+
+    def test_prune_anonymized_data(self):
+        self.call_command(u'gdpr_anonymize_purpose', u'tests.Customer', FIRST_AND_LAST_NAME_SLUG)
+        # Queryset delete skips cleanup of anonymization metadata
+        Customer.objects.filter(pk=self.customers[0].pk).delete()
+
+        progress = self.call_command(u'gdpr_prune_anonymized_data', dry_run=True)
+        self.assertEqual(progress[u'processed'], 2)
+        self.assertEqual(AnonymizedData.objects.count(), 6)
+
+        progress = self.call_command(u'gdpr_prune_anonymized_data')
+        self.assertEqual(progress[u'processed'], 2)
+        self.assertEqual(AnonymizedData.objects.count(), 4)
+        self.assertAnonymizedDataExists(self.customers[1], u'first_name')
@@ -0,0 +1,29 @@
+from __future__ import absolute_import
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from gdpr.content_types import (
+    clear_content_type_cache, get_content_type, get_content_type_id, get_model_for_content_type_id,
+    warm_content_type_cache
+)
+from tests.models import Customer, Email
+
+
+class TestContentTypes(TestCase):
+
+    def setUp(self):
+        clear_content_type_cache()
+        ContentType.objects.clear_cache()
+
+    def test_content_type_id(self):
+        self.assertEqual(get_content_type_id(Customer), ContentType.objects.get_for_model(Customer).pk)
+        self.assertEqual(get_content_type(Customer), ContentType.objects.get_for_model(Customer))
+        self.assertEqual(get_model_for_content_type_id(get_content_type_id(Customer)), Customer)
+
+    def test_registered_models_are_resolved_at_once(self):
+        warm_content_type_cache()
+        with self.assertNumQueries(0):
+            get_content_type_id(Customer)
+            get_content_type_id(Email)
+            get_content_type(Customer)
@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+
+import hashlib
+
+from django.test import TestCase, override_settings
+
+from gdpr.encryption import LRUCache, clear_encryption_key_cache, derive_encryption_key, get_settings_encryption_key
+
+
+class TestEncryptionKeyDerivation(TestCase):
+
+    def setUp(self):
+        clear_encryption_key_cache()
+
+    def test_derived_key_is_compatible(self):
+        expected_key = hashlib.sha256(u'1::LoremIpsum::secret::first_name'.encode(u'utf-8')).hexdigest()
+        self.assertEqual(derive_encryption_key(u'1::LoremIpsum::secret', u'first_name'), expected_key)
+        # Cached key
+        self.assertEqual(derive_encryption_key(u'1::LoremIpsum::secret', u'first_name'), expected_key)
+        self.assertEqual(derive_encryption_key(u'1::LoremIpsum::secret', u'first_name', cache=False), expected_key)
+
+    def test_derived_keys_of_more_fields(self):
+        self.assertNotEqual(
+            derive_encryption_key(u'1::LoremIpsum::secret', u'first_name'),
+            derive_encryption_key(u'1::LoremIpsum::secret', u'last_name')
+        )
+        self.assertEqual(
+            derive_encryption_key(u'1::LoremIpsum::secret', u'last_name'),
+            hashlib.sha256(u'1::LoremIpsum::secret::last_name'.encode(u'utf-8')).hexdigest()
+        )
+
+    def test_settings_key_is_reset_on_setting_change(self):
+        with override_settings(GDPR_KEY=u'first'):
+            self.assertEqual(get_settings_encryption_key(), u'first')
+        with override_settings(GDPR_KEY=u'second'):
+            self.assertEqual(get_settings_encryption_key(), u'second')
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set(u'a', 1)
+        cache.set(u'b', 2)
+        cache.get(u'a')
+        cache.set(u'c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(u'b'))
+        self.assertEqual(cache.get(u'a'), 1)
+        self.assertEqual(cache.get(u'c'), 3)
@@ -0,0 +1,177 @@
+from __future__ import absolute_import
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, TransactionTestCase
+from freezegun import freeze_time
+
+from gdpr.enums import LegalReasonState
+from gdpr import expiration
+from gdpr.expiration import ExpirationEngine, ParallelExpirationRunner
+from gdpr.models import ExpirationCheckpoint, LegalReason
+from tests.models import Customer
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG
+from tests.tests.data import CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS
+from tests.tests.utils import AnonymizedDataMixin
+
+
+class Pool(object):
+    u"""Pool running tasks in the current process, records dispatched tasks."""
+
+    instances = []
+
+    def __init__(self, processes, initializer=None):
+        self.processes = processes
+        self.initializer = initializer
+        self.mapped = []
+        self.is_joined = False
+        self.instances.append(self)
+
+    def map(self, function, tasks, chunksize=None):
+        self.mapped.append((function, list(tasks)))
+        return [function(task) for task in tasks]
+
+    def close(self):
+        pass
+
+    def join(self):
+        self.is_joined = True
+
+
+class TestParallelExpirationRunnerWorkers(AnonymizedDataMixin, TransactionTestCase):
+
+    def setUp(self):
+        self.customers = [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(5)]
+        self.legal_reasons = [customer.create_consent(FIRST_AND_LAST_NAME_SLUG) for customer in self.customers]
+        original_pool = expiration.multiprocessing.Pool
+        expiration.multiprocessing.Pool = Pool
+        self.addCleanup(setattr, expiration.multiprocessing, u'Pool', original_pool)
+        del Pool.instances[:]
+
+    def test_run_dispatches_shards_to_workers(self):
+        with freeze_time(datetime.datetime.now() + relativedelta(years=10, days=1)):
+            runner = ParallelExpirationRunner(workers=2, shard_size=2, chunk_size=1)
+            shards = runner.get_shards()
+            report = runner.run()
+
+        self.assertEqual(len(Pool.instances), 1)
+        pool = Pool.instances[0]
+        self.assertEqual(pool.processes, 2)
+        self.assertIs(pool.initializer, expiration.init_worker)
+        self.assertTrue(pool.is_joined)
+        (function, tasks), = pool.mapped
+        self.assertIs(function, expiration._expire_shard)
+        self.assertListEqual([task[1] for task in tasks], shards)
+
+        self.assertEqual(report.expired, 5)
+        self.assertListEqual(report.failed, [])
+        self.assertEqual(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).count(), 5)
+        for customer in self.customers:
+            self.assertAnonymizedDataExists(Customer.objects.get(pk=customer.pk), u'first_name')
+
+
+class TestParallelExpirationRunner(AnonymizedDataMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(5)]
+        cls.legal_reasons = [customer.create_consent(FIRST_AND_LAST_NAME_SLUG) for customer in cls.customers]
+
+    def get_future(self):
+        return datetime.datetime.now() + relativedelta(years=10, days=1)
+
+    def test_shards_are_disjoint_and_cover_all_legal_reasons(self):
+        with freeze_time(self.get_future()):
+            shards = ParallelExpirationRunner(workers=1, shard_size=2).get_shards()
+
+        self.assertEqual(len(shards), 3)
+        content_type_id = ContentType.objects.get_for_model(Customer).pk
+        covered_pks = []
+        for shard in shards:
+            self.assertEqual(shard.content_type_id, content_type_id)
+            covered_pks += list(LegalReason.objects.filter(pk__range=(shard.pk_from, shard.pk_to)).values_list(
+                u'pk', flat=True))
+        self.assertListEqual(sorted(covered_pks), sorted(i.pk for i in self.legal_reasons))
+
+    def test_workers_are_not_used_inside_transaction(self):
+        with freeze_time(self.get_future()):
+            with self.assertRaises(RuntimeError):
+                ParallelExpirationRunner(workers=2, shard_size=2, chunk_size=1).run()
+        self.assertFalse(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).exists())
+
+    def test_run_merges_shard_reports(self):
+        with freeze_time(self.get_future()):
+            report = ParallelExpirationRunner(workers=1, shard_size=2, chunk_size=1).run()
+
+        self.assertEqual(report.expired, 5)
+        self.assertListEqual(report.failed, [])
+        self.assertEqual(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).count(), 5)
+        for customer in self.customers:
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u'first_name')
+
+    def test_run_expires_only_legal_reasons_of_queryset(self):
+        queryset = LegalReason.objects.filter(pk__in=[i.pk for i in self.legal_reasons[:2]])
+        with freeze_time(self.get_future()):
+            report = ParallelExpirationRunner(queryset, workers=1, shard_size=10, chunk_size=1).run()
+
+        self.assertEqual(report.expired, 2)
+        self.assertListEqual(
+            sorted(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).values_list(u'pk', flat=True)),
+            sorted(i.pk for i in self.legal_reasons[:2])
+        )
+
+    def test_failed_shard_reports_already_expired_legal_reasons(self):
+        process_chunk = ExpirationEngine.__dict__[u'process_chunk']
+        calls = []
+
+        def failing_process_chunk(engine, legal_reasons, report):
+            calls.append(legal_reasons)
+            if len(calls) > 2:
+                raise RuntimeError(u'Chunk failed')
+            process_chunk(engine, legal_reasons, report)
+
+        ExpirationEngine.process_chunk = failing_process_chunk
+        self.addCleanup(setattr, ExpirationEngine, u'process_chunk', process_chunk)
+        with freeze_time(self.get_future()):
+            report = ParallelExpirationRunner(workers=1, shard_size=10, chunk_size=1).run()
+
+        self.assertEqual(report.expired, 2)
+        self.assertEqual(len(report.failed), 1)
+        self.assertIn(u'Chunk failed', report.failed[0][1])
+
+    def test_run_with_run_id_stores_checkpoints(self):
+        with freeze_time(self.get_future()):
+            report = LegalReason.objects.expire_old_consents(chunk_size=2, run_id=u'nightly')
+
+        self.assertEqual(report.expired, 5)
+        checkpoint = ExpirationCheckpoint.objects.get(run_id=u'nightly')
+        self.assertTrue(checkpoint.is_finished)
+        self.assertEqual(checkpoint.last_pk, self.legal_reasons[-1].pk)
+        self.assertEqual(checkpoint.expired, 5)
+        self.assertEqual(checkpoint.failed, 0)
+        self.assertListEqual(checkpoint.get_errors(), [])
+
+        with freeze_time(self.get_future()):
+            self.assertEqual(LegalReason.objects.expire_old_consents(run_id=u'nightly').expired, 0)
+
+    def test_restarted_run_continues_after_last_checkpoint(self):
+        ExpirationCheckpoint.objects.create(
+            run_id=u'nightly', source_object_content_type=ContentType.objects.get_for_model(Customer),
+            pk_from=self.legal_reasons[0].pk, pk_to=self.legal_reasons[-1].pk, last_pk=self.legal_reasons[2].pk,
+            expired=3
+        )
+
+        with freeze_time(self.get_future()):
+            report = LegalReason.objects.expire_old_consents(chunk_size=1, run_id=u'nightly')
+
+        self.assertEqual(report.expired, 2)
+        self.assertEqual(ExpirationCheckpoint.objects.get(run_id=u'nightly').expired, 5)
+        self.assertListEqual(
+            list(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).order_by(u'pk').values_list(
+                u'pk', flat=True)),
+            [i.pk for i in self.legal_reasons[3:]]
+        )
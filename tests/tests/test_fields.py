@@ -1,9 +1,11 @@
 from __future__ import absolute_import
 from django.test import TestCase
 
-from gdpr.fields import Fields
+from gdpr.fields import Fields, clear_fields_cache
+from gdpr.loading import purpose_register
 from tests.anonymizers import CustomerAnonymizer
-from tests.models import Customer
+from tests.models import Customer, Email
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG, FIRST_NAME_SLUG
 
 LOCAL_FIELDS = (u"first_name", u"last_name")
 
@@ -16,3 +18,66 @@ class TestFields(TestCase):
     def test_local(self):
         fields = Fields(LOCAL_FIELDS, Customer)
         self.assertListEqual(fields.local_fields, list(LOCAL_FIELDS))
+
+    def test_related_lookups(self):
+        fields = Fields((u"first_name", (u"emails", (u"email",)), (u"accounts", (u"owner",))), Customer)
+        select_lookups, prefetch_lookups = fields.get_related_lookups()
+        self.assertListEqual(select_lookups, [])
+        self.assertListEqual(sorted(prefetch_lookups), [u"accounts", u"emails"])
+
+    def test_related_lookups_foreign_key(self):
+        fields = Fields((u"email", (u"customer", (u"first_name", (u"accounts", (u"owner",))))), Email)
+        select_lookups, prefetch_lookups = fields.get_related_lookups()
+        self.assertListEqual(select_lookups, [u"customer"])
+        self.assertListEqual(prefetch_lookups, [u"customer__accounts"])
+
+    def test_purpose_fields_are_parsed_once(self):
+        parse_calls = []
+        original_parse_local_fields = Fields.__dict__['parse_local_fields']
+
+        def parse_local_fields(fields, fields_matrix):
+            parse_calls.append(fields_matrix)
+            return original_parse_local_fields(fields, fields_matrix)
+
+        Fields.parse_local_fields = parse_local_fields
+        self.addCleanup(setattr, Fields, 'parse_local_fields', original_parse_local_fields)
+        clear_fields_cache()
+
+        fields = purpose_register[FIRST_AND_LAST_NAME_SLUG]().get_parsed_fields(Customer)
+        other_fields = purpose_register[FIRST_AND_LAST_NAME_SLUG]().get_parsed_fields(Customer)
+        self.assertEqual(len(parse_calls), 1)
+        self.assertEqual(other_fields.get_tuple(), fields.get_tuple())
+
+    def test_cached_fields_have_new_anonymizers(self):
+        fields = purpose_register[FIRST_AND_LAST_NAME_SLUG]().get_parsed_fields(Customer)
+        fields.anonymizer.set_base_encryption_key(u'LoremIpsumDolorSitAmet')
+        other_fields = purpose_register[FIRST_AND_LAST_NAME_SLUG]().get_parsed_fields(Customer)
+
+        self.assertIsNot(other_fields.anonymizer, fields.anonymizer)
+        self.assertIsInstance(other_fields.anonymizer, CustomerAnonymizer)
+        self.assertIsNone(other_fields.anonymizer._base_encryption_key)
+
+    def test_cached_related_fields_have_new_anonymizers(self):
+        fields = Fields((u"first_name", (u"emails", (u"email",))), Customer)
+        fields_copy = fields.copy_with_new_anonymizers()
+
+        self.assertEqual(fields_copy.get_tuple(), fields.get_tuple())
+        self.assertIsNot(fields_copy.related_fields[u"emails"].anonymizer, fields.related_fields[u"emails"].anonymizer)
+
+    def test_subtraction_does_not_change_fields(self):
+        fields = purpose_register[FIRST_AND_LAST_NAME_SLUG]().get_parsed_fields(Customer)
+        remaining_fields = fields
+        remaining_fields -= purpose_register[FIRST_NAME_SLUG]().get_parsed_fields(Customer)
+
+        self.assertListEqual(remaining_fields.local_fields, [u"last_name"])
+        self.assertListEqual(fields.local_fields, list(LOCAL_FIELDS))
+
+    def test_purpose_fields_without_other_purposes(self):
+        purpose = purpose_register[FIRST_AND_LAST_NAME_SLUG]()
+        fields = purpose.get_parsed_fields_without(Customer, {FIRST_NAME_SLUG})
+
+        self.assertListEqual(fields.local_fields, [u"last_name"])
+        self.assertEqual(purpose.get_parsed_fields_without(Customer, [FIRST_NAME_SLUG]).get_tuple(), fields.get_tuple())
+        self.assertEqual(
+            purpose.get_parsed_fields_without(Customer, ()).get_tuple(), purpose.get_parsed_fields(Customer).get_tuple()
+        )
@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+
+import hashlib
+from functools import partial
+
+from django.db import connection
+from django.db.models import Func
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from gdpr.anonymizers import MD5TextFieldAnonymizer, SHA256TextFieldAnonymizer
+from gdpr.anonymizers.hash_fields import MD5
+from tests.anonymizers import CustomerAnonymizer
+from tests.models import Customer
+from .data import CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS
+from .utils import AnonymizedDataMixin
+
+
+def hash_text(algorithm, value):
+    return None if value is None else hashlib.new(algorithm, value.encode(u'utf-8')).hexdigest()
+
+
+class SQLiteSHA256(Func):
+
+    function = u'SHA256'
+
+
+# Hash functions registered to the SQLite connection of the test
+SQLITE_DB_FUNCTIONS = {
+    u'md5': (MD5, lambda connection: True),
+    u'sha256': (SQLiteSHA256, lambda connection: True),
+}
+
+
+class DatabaseConnection(object):
+
+    def __init__(self, vendor, pg_version=None):
+        self.vendor = vendor
+        self.pg_version = pg_version
+
+
+class TestHashTextFieldDatabaseExpression(AnonymizedDataMixin, TestCase):
+
+    def test_db_expression_is_optional(self):
+        self.assertIsNone(MD5TextFieldAnonymizer().get_db_expression(u'first_name', DatabaseConnection(u'postgresql')))
+
+    def test_db_expression_supported_databases(self):
+        anonymizer = MD5TextFieldAnonymizer(use_db_expression=True)
+        self.assertIsNotNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'postgresql')))
+        self.assertIsNotNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'mysql')))
+        self.assertIsNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'sqlite')))
+
+    def test_sha256_db_expression_requires_postgresql_11(self):
+        anonymizer = SHA256TextFieldAnonymizer(use_db_expression=True)
+        self.assertIsNotNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'postgresql', 110000)))
+        self.assertIsNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'postgresql', 100000)))
+
+    def test_db_expression_is_not_used_with_custom_empty_values(self):
+        anonymizer = MD5TextFieldAnonymizer(use_db_expression=True, empty_values=[None, u''])
+        self.assertIsNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'postgresql')))
+
+    def test_db_expression_is_not_used_with_overridden_value_methods(self):
+        class CustomMD5TextFieldAnonymizer(MD5TextFieldAnonymizer):
+
+            def get_encrypted_value(self, value, encryption_key):
+                return value[::-1]
+
+        class CustomEmptyMD5TextFieldAnonymizer(MD5TextFieldAnonymizer):
+
+            def get_is_value_empty(self, value):
+                return not value
+
+        for anonymizer_class in (CustomMD5TextFieldAnonymizer, CustomEmptyMD5TextFieldAnonymizer):
+            anonymizer = anonymizer_class(use_db_expression=True)
+            self.assertIsNone(anonymizer.get_db_expression(u'first_name', DatabaseConnection(u'postgresql')))
+
+    def test_anonymize_qs_with_db_expression_falls_back_to_python_on_unsupported_database(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        anonymizer = CustomerAnonymizer()
+        anonymizer.fields = {u'first_name': MD5TextFieldAnonymizer(use_db_expression=True)}
+
+        anonymizer.anonymize_qs(Customer.objects.filter(pk=customer.pk))
+
+        anon_customer = Customer.objects.get(pk=customer.pk)
+        self.assertEqual(
+            anon_customer.first_name,
+            MD5TextFieldAnonymizer().get_encrypted_value(CUSTOMER__FIRST_NAME, None)
+        )
+        self.assertAnonymizedDataExists(anon_customer, u'first_name')
+
+    def test_anonymize_qs_with_db_expression(self):
+        connection.ensure_connection()
+        for name in (u'md5', u'sha256'):
+            connection.connection.create_function(name.upper(), 1, partial(hash_text, name))
+
+        for anonymizer_class in (MD5TextFieldAnonymizer, SHA256TextFieldAnonymizer):
+            customer = Customer.objects.create(**CUSTOMER__KWARGS)
+            field_anonymizer = anonymizer_class(use_db_expression=True)
+            field_anonymizer.db_functions = SQLITE_DB_FUNCTIONS
+            anonymizer = CustomerAnonymizer()
+            anonymizer.fields = {u'first_name': field_anonymizer}
+
+            with CaptureQueriesContext(connection) as queries:
+                anonymizer.anonymize_qs(Customer.objects.filter(pk=customer.pk))
+
+            self.assertTrue(any(
+                u'{}('.format(field_anonymizer.algorithm.upper()) in query[u'sql'] for query in queries.captured_queries
+            ))
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertEqual(
+                anon_customer.first_name, anonymizer_class().get_encrypted_value(CUSTOMER__FIRST_NAME, None)
+            )
+            self.assertAnonymizedDataExists(anon_customer, u'first_name')
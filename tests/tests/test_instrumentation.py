@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+
+from django.test import TestCase, override_settings
+
+from gdpr.instrumentation import InMemoryInstrumentation, get_instrumentation
+from tests.models import Customer
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG
+from tests.tests.data import CUSTOMER__KWARGS
+
+
+@override_settings(GDPR_INSTRUMENTATION=u'gdpr.instrumentation.InMemoryInstrumentation')
+class TestInMemoryInstrumentation(TestCase):
+
+    def test_anonymization_is_instrumented(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        customer.deactivate_consent(FIRST_AND_LAST_NAME_SLUG)
+
+        instrumentation = get_instrumentation()
+        tags = ((u'model', u'tests.Customer'), (u'purpose', FIRST_AND_LAST_NAME_SLUG))
+        self.assertEqual(instrumentation.counters[(u'fields_anonymized', tags)], 2)
+        self.assertEqual(
+            instrumentation.counters[(u'legal_reasons_deactivated', ((u'purpose', FIRST_AND_LAST_NAME_SLUG),))], 1
+        )
+        # Queries are counted only if enabled
+        self.assertListEqual([name for name, _ in instrumentation.counters if name == u'queries'], [])
+        self.assertEqual(instrumentation.spans[(u'update_obj', tags)][0], 1)
+        self.assertIn((u'db_write', ((u'model', u'tests.Customer'),)), instrumentation.spans)
+        self.assertIn((u'hashing', tags), instrumentation.spans)
+
+    def test_span_counts_queries(self):
+        instrumentation = InMemoryInstrumentation(count_queries=True)
+        with instrumentation.span(u'load', model=u'tests.Customer'):
+            list(Customer.objects.all())
+            list(Customer.objects.all())
+
+        self.assertEqual(
+            instrumentation.counters[(u'queries', ((u'model', u'tests.Customer'), (u'phase', u'load')))], 2
+        )
+
+    def test_render(self):
+        instrumentation = InMemoryInstrumentation()
+        instrumentation.increment(u'fields_anonymized', 3, model=u'tests.Customer', purpose=u'a"b')
+        instrumentation.add_span(u'db_write', 0.5, model=u'tests.Customer')
+        instrumentation.add_span(u'db_write', 0.25, model=u'tests.Customer')
+
+        self.assertEqual(
+            instrumentation.render_prometheus(),
+            u'# TYPE gdpr_fields_anonymized_total counter\n'
+            u'gdpr_fields_anonymized_total{model="tests.Customer",purpose="a\\"b"} 3\n'
+            u'# TYPE gdpr_span_seconds summary\n'
+            u'gdpr_span_seconds_count{phase="db_write",model="tests.Customer"} 2\n'
+            u'gdpr_span_seconds_sum{phase="db_write",model="tests.Customer"} 0.75\n'
+        )
+        self.assertListEqual(instrumentation.render_statsd(), [
+            u'gdpr.fields_anonymized:3|c|#model:tests.Customer,purpose:a"b',
+            u'gdpr.span.db_write.count:2|c|#model:tests.Customer',
+            u'gdpr.span.db_write.ms:750|c|#model:tests.Customer',
+        ])
+
+        instrumentation.reset()
+        self.assertEqual(instrumentation.render_prometheus(), u'')
@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+
+from django.test import TestCase, override_settings
+
+from gdpr.enums import AnonymizationJobState, LegalReasonState
+from gdpr.models import AnonymizationJob, LegalReason
+from tests.models import Customer
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG
+from tests.tests.data import CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS
+from tests.tests.utils import AnonymizedDataMixin
+
+
+@override_settings(GDPR_ANONYMIZATION_BACKEND=u'gdpr.jobs.DatabaseQueueBackend')
+class TestDatabaseQueueBackend(AnonymizedDataMixin, TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(**CUSTOMER__KWARGS)
+
+    def test_deactivate_consent_is_anonymized_by_worker(self):
+        self.customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        self.customer.deactivate_consent(FIRST_AND_LAST_NAME_SLUG)
+
+        self.assertEqual(LegalReason.objects.get().state, LegalReasonState.DEACTIVATED)
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).first_name, CUSTOMER__FIRST_NAME)
+        self.assertEqual(AnonymizationJob.objects.get().state, AnonymizationJobState.PENDING)
+
+        self.assertEqual(AnonymizationJob.objects.process_pending(), 1)
+
+        anon_customer = Customer.objects.get(pk=self.customer.pk)
+        self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+        self.assertAnonymizedDataExists(anon_customer, u'first_name')
+        self.assertEqual(AnonymizationJob.objects.get().state, AnonymizationJobState.DONE)
+        self.assertEqual(AnonymizationJob.objects.process_pending(), 0)
+
+    def test_renewed_legal_reason_is_not_anonymized(self):
+        legal_reason = self.customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        legal_reason.expire()
+        LegalReason.objects.filter(pk=legal_reason.pk).update(state=LegalReasonState.ACTIVE)
+
+        AnonymizationJob.objects.process_pending()
+
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).first_name, CUSTOMER__FIRST_NAME)
+        self.assertAnonymizedDataNotExists(self.customer, u'first_name')
@@ -4,15 +4,17 @@ import datetime
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from faker import Faker
 from freezegun import freeze_time
 
 from gdpr.enums import LegalReasonState
-from gdpr.models import LegalReason
-from tests.models import Customer
+from gdpr.models import LegalReason, LegalReasonRelatedObject
+from tests.models import Customer, Email
 from tests.purposes import (
-    FIRST_AND_LAST_NAME_SLUG)
+    FIRST_AND_LAST_NAME_SLUG, FIRST_NAME_SLUG)
 from tests.tests.data import (
     CUSTOMER__EMAIL,
     CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS,
@@ -154,3 +156,169 @@ class TestLegalReason(AnonymizedDataMixin, NotImplementedMixin, TestCase):
             self.assertAnonymizedDataNotExists(customer, u"last_name")
             self.assertEqual(customer.primary_email_address, CUSTOMER__EMAIL)
             self.assertAnonymizedDataNotExists(customer, u"primary_email_address")
+
+    def test_expire_old_consents_in_chunks(self):
+        customers = [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(3)]
+        for customer in customers:
+            customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=10, days=1)):
+            report = LegalReason.objects.expire_old_consents(chunk_size=2)
+
+        self.assertEqual(report.expired, 3)
+        self.assertListEqual(report.failed, [])
+        self.assertFalse(LegalReason.objects.filter_active().exists())
+        for customer in customers:
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u"first_name")
+            self.assertNotEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u"last_name")
+
+    def test_expire_old_consents_of_same_object(self):
+        """
+        Consents of one object expiring in the same run must not retain each other's fields.
+        """
+        customer = Customer.objects.get(pk=self.customer.pk)
+        customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        customer.create_consent(FIRST_NAME_SLUG)
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=10, days=1)):
+            LegalReason.objects.expire_old_consents()
+
+        anon_customer = Customer.objects.get(pk=self.customer.pk)
+        self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+        self.assertAnonymizedDataExists(anon_customer, u"first_name")
+        self.assertNotEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
+        self.assertAnonymizedDataExists(anon_customer, u"last_name")
+        self.assertEqual(LegalReason.objects.filter(state=LegalReasonState.EXPIRED).count(), 2)
+
+    def test_expire_old_consents_of_removed_object(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        legal = customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        Customer.objects.filter(pk=customer.pk).delete()
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=10, days=1)):
+            report = LegalReason.objects.expire_old_consents()
+
+        self.assertEqual(report.expired, 1)
+        self.assertEqual(LegalReason.objects.get(pk=legal.pk).state, LegalReasonState.EXPIRED)
+
+    def test_create_consents_bulk(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        email = Email.objects.create(customer=customer, email=CUSTOMER__EMAIL)
+        legal = LegalReason.objects.create_consent(FIRST_NAME_SLUG, self.customer)
+        LegalReason.objects.filter(pk=legal.pk).update(state=LegalReasonState.DEACTIVATED)
+
+        legal_reasons = LegalReason.objects.create_consents_bulk((
+            (self.customer, FIRST_NAME_SLUG),
+            (self.customer, FIRST_AND_LAST_NAME_SLUG, (email,)),
+            (customer, FIRST_AND_LAST_NAME_SLUG, (email,)),
+        ), tag=u'import')
+
+        self.assertEqual(len(legal_reasons), 3)
+        self.assertEqual(legal_reasons[0].pk, legal.pk)
+        self.assertEqual(LegalReason.objects.count(), 3)
+        self.assertEqual(
+            LegalReason.objects.filter(tag=u'import', state=LegalReasonState.ACTIVE).count(), 3
+        )
+        self.assertTrue(
+            LegalReason.objects.filter_source_instance_active_non_expired_purpose(customer, FIRST_AND_LAST_NAME_SLUG)
+            .filter(related_objects__object_id=str(email.pk)).exists()
+        )
+        self.assertEqual(LegalReasonRelatedObject.objects.count(), 2)
+
+        # Repeated call renews existing consents only
+        LegalReason.objects.create_consents_bulk(((customer, FIRST_AND_LAST_NAME_SLUG, (email,)),))
+        self.assertEqual(LegalReason.objects.count(), 3)
+        self.assertEqual(LegalReasonRelatedObject.objects.count(), 2)
+
+    def test_create_consents_bulk_renews_expiration(self):
+        legal = LegalReason.objects.create_consent(FIRST_AND_LAST_NAME_SLUG, self.customer)
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=1)):
+            renewed_at = timezone.now()
+            LegalReason.objects.create_consents_bulk(((self.customer, FIRST_AND_LAST_NAME_SLUG),))
+        expires_at = renewed_at + relativedelta(years=10)
+
+        self.assertEqual(LegalReason.objects.get(pk=legal.pk).expires_at, expires_at)
+        self.assertTrue(LegalReason.objects.filter(pk=legal.pk, expires_at__lte=expires_at).exists())
+        self.assertFalse(
+            LegalReason.objects.filter(pk=legal.pk, expires_at__lte=expires_at - relativedelta(seconds=1)).exists()
+        )
+        with freeze_time(expires_at - relativedelta(days=1)):
+            self.assertEqual(LegalReason.objects.expire_old_consents().expired, 0)
+        with freeze_time(expires_at + relativedelta(days=1)):
+            self.assertEqual(LegalReason.objects.expire_old_consents().expired, 1)
+
+    def test_get_consents_bulk(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        other_customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        customer.create_consent(FIRST_NAME_SLUG)
+        other_customer.create_consent(FIRST_NAME_SLUG)
+        other_customer.deactivate_consent(FIRST_NAME_SLUG)
+
+        with self.assertNumQueries(1):
+            valid_consents = LegalReason.objects.get_valid_consents_bulk([customer, other_customer])
+        self.assertEqual(valid_consents, {customer.pk: {FIRST_AND_LAST_NAME_SLUG, FIRST_NAME_SLUG}})
+
+        with self.assertNumQueries(1):
+            valid_consents = LegalReason.objects.get_valid_consents_bulk(
+                Customer.objects.filter(pk__in=(customer.pk, other_customer.pk)), (FIRST_NAME_SLUG,)
+            )
+        self.assertEqual(valid_consents, {customer.pk: {FIRST_NAME_SLUG}})
+
+        self.assertEqual(
+            LegalReason.objects.get_deactivated_consents_bulk([customer, other_customer]),
+            {other_customer.pk: {FIRST_NAME_SLUG}}
+        )
+
+    def test_filter_valid_consent(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        other_customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        customer.create_consent(FIRST_NAME_SLUG)
+        other_customer.create_consent(FIRST_AND_LAST_NAME_SLUG)
+        customers = Customer.objects.filter(pk__in=(customer.pk, other_customer.pk))
+
+        self.assertEqual(list(customers.filter_valid_consent(FIRST_NAME_SLUG)), [customer])
+        self.assertEqual(list(customers.exclude_valid_consent(FIRST_NAME_SLUG)), [other_customer])
+        annotated_customers = customers.annotate_has_valid_consent(FIRST_AND_LAST_NAME_SLUG)
+        self.assertEqual(
+            dict(annotated_customers.values_list(u'pk', u'has_valid_consent')),
+            {customer.pk: False, other_customer.pk: True}
+        )
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=10, days=1)):
+            self.assertFalse(customers.filter_valid_consent(FIRST_NAME_SLUG).exists())
+
+    def test_filter_valid_consent_with_any_slug(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        customer.create_consent(FIRST_NAME_SLUG)
+        customers = Customer.objects.filter(pk=customer.pk)
+
+        self.assertEqual(list(customers.filter_valid_consent(u'news-letter__v2')), [])
+        self.assertEqual(list(customers.exclude_valid_consent(u'news-letter__v2')), [customer])
+        self.assertEqual(
+            list(customers.filter_valid_consent(FIRST_NAME_SLUG).exclude_valid_consent(FIRST_AND_LAST_NAME_SLUG)),
+            [customer]
+        )
+
+    def test_integer_object_id(self):
+        customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        legal = customer.create_consent(FIRST_NAME_SLUG)
+        self.assertEqual(LegalReason.objects.get(pk=legal.pk).source_object_id_int, customer.pk)
+
+        LegalReason.objects.filter(pk=legal.pk).update(source_object_id_int=None)
+        call_command(u'gdpr_backfill_object_id_int')
+        self.assertEqual(LegalReason.objects.get(pk=legal.pk).source_object_id_int, customer.pk)
+
+        with override_settings(GDPR_USE_INTEGER_OBJECT_ID=True):
+            self.assertTrue(LegalReason.objects.exists_valid_consent(FIRST_NAME_SLUG, customer))
+            self.assertEqual(
+                LegalReason.objects.get_valid_consents_bulk(Customer.objects.filter(pk=customer.pk)),
+                {customer.pk: {FIRST_NAME_SLUG}}
+            )
+            self.assertEqual(
+                list(Customer.objects.filter(pk=customer.pk).filter_valid_consent(FIRST_NAME_SLUG)), [customer]
+            )
@@ -1,9 +1,18 @@
 from __future__ import absolute_import
 
-from django.test import TestCase
+import warnings
+from unittest import skipUnless
 
-from tests.models import Customer
-from .data import (CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS, CUSTOMER__LAST_NAME)
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from gdpr.enums import AnonymizationUpdateMode
+from gdpr.utils import get_reversion_versions, is_reversion_installed
+from tests.anonymizers import CustomerAnonymizer
+from tests.models import Account, Customer, Email
+from .data import (
+    ACCOUNT__OWNER, CUSTOMER__EMAIL, CUSTOMER__EMAIL2, CUSTOMER__FIRST_NAME, CUSTOMER__KWARGS, CUSTOMER__LAST_NAME
+)
 from .utils import AnonymizedDataMixin, NotImplementedMixin
 
 
@@ -46,3 +55,168 @@ class TestModelAnonymization(AnonymizedDataMixin, NotImplementedMixin, TestCase)
 
         self.assertEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
         self.assertAnonymizedDataNotExists(anon_customer, u'last_name')
+
+    def test_get_anonymized_fields_bulk(self):
+        other_customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        self.customer._anonymize_obj(fields=(u'first_name',))
+
+        with self.assertNumQueries(1):
+            anonymized_fields = CustomerAnonymizer().get_anonymized_fields_bulk([self.customer, other_customer])
+
+        self.assertDictEqual(anonymized_fields, {
+            unicode(self.customer.pk): {u'first_name'},
+            unicode(other_customer.pk): set(),
+        })
+
+    def test_preloaded_anonymized_fields(self):
+        self.customer._anonymize_obj(fields=(u'first_name',))
+        anonymizer = CustomerAnonymizer()
+        anonymizer.preload_anonymized_fields([self.customer])
+
+        with self.assertNumQueries(0):
+            self.assertSetEqual(anonymizer.get_anonymized_fields(self.customer), {u'first_name'})
+
+    def test_bulk_update_fields_as_anonymized(self):
+        other_customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        anonymizer = CustomerAnonymizer()
+        objs_fields = ((self.customer, (u'first_name', u'last_name')), (other_customer, (u'first_name', u'last_name')))
+
+        with self.assertNumQueries(1):
+            anonymizer.bulk_update_fields_as_anonymized(objs_fields)
+        self.assertAnonymizedDataExists(self.customer, u'last_name')
+        self.assertAnonymizedDataExists(other_customer, u'first_name')
+
+        anonymizer.bulk_update_fields_as_anonymized(objs_fields, anonymization=False)
+        self.assertAnonymizedDataNotExists(self.customer, u'last_name')
+        self.assertAnonymizedDataNotExists(other_customer, u'first_name')
+
+    def _test_update_mode_writes_only_anonymized_fields(self, update_mode):
+        CustomerAnonymizer.Meta.update_mode = update_mode
+        try:
+            customer = Customer.objects.get(pk=self.customer.pk)
+            Customer.objects.filter(pk=customer.pk).update(primary_email_address=CUSTOMER__EMAIL2)
+            customer._anonymize_obj()
+        finally:
+            del CustomerAnonymizer.Meta.update_mode
+
+        anon_customer = Customer.objects.get(pk=self.customer.pk)
+        self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+        self.assertAnonymizedDataExists(anon_customer, u'first_name')
+        self.assertNotEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
+        # Stale value of not anonymized field was not written
+        self.assertEqual(anon_customer.primary_email_address, CUSTOMER__EMAIL2)
+
+    def test_update_fields_update_mode(self):
+        self._test_update_mode_writes_only_anonymized_fields(AnonymizationUpdateMode.UPDATE_FIELDS)
+
+    def test_queryset_update_mode(self):
+        self._test_update_mode_writes_only_anonymized_fields(AnonymizationUpdateMode.QUERYSET)
+
+    def test_anonymize_qs(self):
+        customers = [self.customer] + [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(4)]
+        self.customer._anonymize_obj(fields=(u'first_name',))
+        anonymized_first_name = Customer.objects.get(pk=self.customer.pk).first_name
+
+        anonymizer = CustomerAnonymizer()
+        anonymizer.chunk_size = 2
+        anonymizer.anonymize_qs(Customer.objects.filter(pk__in=[i.pk for i in customers]))
+
+        for customer in customers:
+            anon_customer = Customer.objects.get(pk=customer.pk)
+            self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u'first_name')
+            self.assertNotEqual(anon_customer.last_name, CUSTOMER__LAST_NAME)
+            self.assertAnonymizedDataExists(anon_customer, u'last_name')
+        # Already anonymized field is not anonymized again
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).first_name, anonymized_first_name)
+
+    def test_anonymize_related_objects(self):
+        emails = [Email.objects.create(customer=self.customer, email=CUSTOMER__EMAIL) for _ in range(3)]
+        account = Account.objects.create(customer=self.customer, owner=ACCOUNT__OWNER)
+        customer = Customer.objects.get(pk=self.customer.pk)
+
+        customer._anonymize_obj(fields=(u'first_name', (u'emails', (u'email',)), (u'accounts', u'__ALL__')))
+
+        for email in emails:
+            anon_email = Email.objects.get(pk=email.pk)
+            self.assertNotEqual(anon_email.email, CUSTOMER__EMAIL)
+            self.assertAnonymizedDataExists(anon_email, u'email')
+        anon_account = Account.objects.get(pk=account.pk)
+        self.assertNotEqual(anon_account.owner, ACCOUNT__OWNER)
+        self.assertAnonymizedDataExists(anon_account, u'owner')
+
+    @override_settings(GDPR_QUERY_BUDGET=1, GDPR_QUERY_BUDGET_ACTION=u'raise')
+    def test_query_budget_exceeded_raises_and_rolls_back(self):
+        with self.assertRaises(CustomerAnonymizer.QueryBudgetExceededException):
+            self.customer._anonymize_obj()
+
+        customer = Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual(customer.first_name, CUSTOMER__FIRST_NAME)
+        self.assertAnonymizedDataNotExists(customer, u'first_name')
+
+    @override_settings(GDPR_QUERY_BUDGET=1, GDPR_QUERY_BUDGET_ACTION=u'warn')
+    def test_query_budget_exceeded_warns(self):
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter(u'always')
+            self.customer._anonymize_obj()
+
+        messages = [unicode(warning.message) for warning in caught_warnings]
+        self.assertEqual(len([message for message in messages if u'query budget is 1' in message]), 1)
+        self.assertNotEqual(Customer.objects.get(pk=self.customer.pk).first_name, CUSTOMER__FIRST_NAME)
+
+    @override_settings(GDPR_QUERY_BUDGET=1, GDPR_QUERY_BUDGET_ACTION=u'raise')
+    def test_query_budget_guard_with_full_query_log(self):
+        # Queries are counted independently of the query log which stops growing when it reaches its cap
+        connection.force_debug_cursor = True
+        self.addCleanup(setattr, connection, u'force_debug_cursor', False)
+        self.addCleanup(connection.queries_log.clear)
+        connection.queries_log.extend([{}] * connection.queries_log.maxlen)
+
+        with self.assertRaises(CustomerAnonymizer.QueryBudgetExceededException):
+            self.customer._anonymize_obj()
+
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).first_name, CUSTOMER__FIRST_NAME)
+
+    @override_settings(GDPR_QUERY_BUDGET=100, GDPR_QUERY_BUDGET_ACTION=u'raise')
+    def test_query_budget_not_exceeded(self):
+        self.customer._anonymize_obj()
+
+        self.assertNotEqual(Customer.objects.get(pk=self.customer.pk).first_name, CUSTOMER__FIRST_NAME)
+
+
+@skipUnless(is_reversion_installed(), u'django-reversion is not installed')
+class TestReversionAnonymization(AnonymizedDataMixin, TestCase):
+
+    def setUp(self):
+        from reversion import revisions as reversion
+
+        with reversion.create_revision():
+            self.customer = Customer.objects.create(**CUSTOMER__KWARGS)
+        with reversion.create_revision():
+            self.customer.save()
+        self.anonymizer = CustomerAnonymizer()
+        self.anonymizer.anonymize_reversion = lambda obj: True
+
+    def get_versions(self):
+        return list(get_reversion_versions(self.customer))
+
+    def test_versions_are_anonymized_in_bulk(self):
+        self.anonymizer.version_chunk_size = 1
+        self.anonymizer.anonymize_obj(self.customer, fields=(u'first_name',))
+        anon_customer = Customer.objects.get(pk=self.customer.pk)
+
+        self.assertNotEqual(anon_customer.first_name, CUSTOMER__FIRST_NAME)
+        versions = self.get_versions()
+        self.assertEqual(len(versions), 2)
+        for version in versions:
+            self.assertEqual(version.field_dict[u'first_name'], anon_customer.first_name)
+            self.assertEqual(version.field_dict[u'last_name'], CUSTOMER__LAST_NAME)
+
+    def test_overridden_get_reversion_versions_is_used(self):
+        first_version = self.get_versions()[0]
+        self.anonymizer.get_reversion_versions = lambda obj: [first_version]
+        self.anonymizer.anonymize_obj(self.customer, fields=(u'first_name',))
+
+        first_version, second_version = self.get_versions()
+        self.assertNotEqual(first_version.field_dict[u'first_name'], CUSTOMER__FIRST_NAME)
+        self.assertEqual(second_version.field_dict[u'first_name'], CUSTOMER__FIRST_NAME)
@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+
+from gdpr.fields import Fields
+from gdpr.planning import AnonymizationEstimate, AnonymizationPlanner
+from tests.models import Account, Customer, Email
+from tests.purposes import FIRST_AND_LAST_NAME_SLUG, FIRST_NAME_SLUG
+from tests.tests.data import ACCOUNT__OWNER, CUSTOMER__EMAIL, CUSTOMER__KWARGS
+
+
+class TestAnonymizationPlanner(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [Customer.objects.create(**CUSTOMER__KWARGS) for _ in range(2)]
+        for customer in cls.customers:
+            for _ in range(2):
+                Email.objects.create(customer=customer, email=CUSTOMER__EMAIL)
+            Account.objects.create(customer=customer, owner=ACCOUNT__OWNER)
+
+    def test_estimate_objects_walks_fields_tree_with_count_queries(self):
+        fields = Fields((u'first_name', (u'emails', (u'email',)), (u'accounts', (u'owner',))), Customer)
+
+        with self.assertNumQueries(3):
+            estimate = AnonymizationPlanner().estimate_objects(
+                Customer.objects.filter(pk=self.customers[0].pk), fields
+            )
+
+        self.assertDictEqual(dict(estimate.objects), {Customer: 1, Email: 2, Account: 1})
+        self.assertEqual(estimate.anonymized_data, 4)
+        self.assertListEqual(estimate.unestimated, [])
+
+    def test_estimate_expiration(self):
+        self.customers[0].create_consent(FIRST_AND_LAST_NAME_SLUG)
+        self.customers[1].create_consent(FIRST_NAME_SLUG)
+
+        with freeze_time(datetime.datetime.now() + relativedelta(years=5, days=1)):
+            estimate = AnonymizationPlanner().estimate_expiration()
+
+        self.assertEqual(estimate.legal_reasons, 1)
+        self.assertDictEqual(dict(estimate.objects), {Customer: 1})
+        self.assertEqual(estimate.anonymized_data, 1)
+
+    @override_settings(GDPR_ANONYMIZATION_COSTS={u'object': 1, u'tests.Email': 2, u'anonymized_data': 0.5})
+    def test_estimated_seconds(self):
+        estimate = AnonymizationEstimate()
+        estimate.add_objects(Customer, 2)
+        estimate.add_objects(Email, 3)
+        estimate.anonymized_data = 4
+
+        self.assertEqual(estimate.get_estimated_seconds(), 2 + 6 + 2)
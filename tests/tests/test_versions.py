@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import datetime
+from decimal import Decimal
+
+from django.core import serializers
+from django.test import TestCase
+
+from gdpr.versions import SerializedVersionData, to_json_value
+from tests.models import Customer, ParentB
+
+
+class Version(object):
+
+    def __init__(self, obj, format=u'json'):
+        self.format = format
+        self.serialized_data = serializers.serialize(format, (obj,))
+
+
+class TestSerializedVersionData(TestCase):
+
+    def test_read_and_update_fields(self):
+        obj = ParentB(pk=1, name=u'Lorem', birth_date=datetime.date(1990, 1, 2))
+        version = Version(obj)
+        # Fields of parent models are stored in versions of the parent models
+        version_data = SerializedVersionData.from_version(version, (u'name', u'birth_date'))
+
+        self.assertEqual(version_data.field_dict, {u'birth_date': datetime.date(1990, 1, 2)})
+        self.assertNotIn(u'name', version_data)
+
+        version_data.update({u'birth_date': datetime.date(2000, 3, 4)})
+        obj.birth_date = datetime.date(2000, 3, 4)
+        self.assertEqual(version.serialized_data, serializers.serialize(u'json', (obj,)))
+
+    def test_updated_data_are_encoded_as_by_django_serializer(self):
+        customer = Customer(pk=1, first_name=u'Žluťoučký', last_name=u'Kůň / "Ipsum"')
+        version = Version(customer)
+        version_data = SerializedVersionData.from_version(version, (u'last_name',))
+
+        version_data.update({u'last_name': u'Úpěl ďábelské ódy'})
+        customer.last_name = u'Úpěl ďábelské ódy'
+        self.assertEqual(version.serialized_data, serializers.serialize(u'json', (customer,)))
+
+    def test_unsupported_versions(self):
+        customer = Customer(pk=1, first_name=u'Lorem', last_name=u'Ipsum')
+        self.assertIsNone(SerializedVersionData.from_version(Version(customer, u'xml'), (u'first_name',)))
+        self.assertIsNotNone(SerializedVersionData.from_version(Version(customer), (u'first_name',)))
+
+
+class TestJSONValue(TestCase):
+
+    def test_values_are_encoded_as_by_django_serializer(self):
+        self.assertEqual(to_json_value(datetime.datetime(2018, 1, 2, 3, 4, 5, 6000)), u'2018-01-02T03:04:05.006')
+        self.assertEqual(to_json_value(datetime.date(2018, 1, 2)), u'2018-01-02')
+        self.assertEqual(to_json_value(Decimal(u'1.50')), u'1.50')
+        self.assertEqual(to_json_value(5), 5)
+        self.assertIsNone(to_json_value(None))